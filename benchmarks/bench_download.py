@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Run the downloader on the local mock server (mock_server.py, in another process) for both
+# websites, and report:
+#   - pages/s of get_page_soup on album pages, and the parse time of one album page,
+#   - for each number of connections: the time to download a whole artist, MB/s
+#     and the CPU time used by the downloader per MB.
+#
+# Usage: bench_download.py [-a ALBUMS] [-t TRACKS] [-s SIZE_KB] [-n 1,3,6] [--latency MS]
+#                          [--bandwidth KB/s] [--limit_rate RATE] [--error_rate RATE]
+#                          [--sites myzuka,musify] [--albums_per_page N]
+# The retry pauses are shortened to --retry_delay seconds (and retried without limit), they would
+# hide everything else when the "download limit exceeded" pages are served.
+
+import os
+import time
+import shutil
+import argparse
+import tempfile
+import multiprocessing
+
+from bs4 import BeautifulSoup
+from rich.console import Console
+
+from common import load_downloader
+from mock_server import MockServer
+
+# the website is recognized from the domain, all of them are sent to the mock server (see MockPool)
+base_urls = {"myzuka": "http://myzuka.test", "musify": "http://musify.test"}
+artist_paths = {"myzuka": "/Artist/1/Foo", "musify": "/artist/foo-1"}
+album_paths = {"myzuka": "/Album/1/Album-1", "musify": "/release/foo-album-1"}
+
+
+def serve(conn, options):
+    # answers the "hits" command with the requests counted since the last one
+    server = MockServer(**options).start()
+    conn.send(server.server_address[1])
+    while True:
+        command = conn.recv()
+        if command == "hits":
+            with server.lock:
+                conn.send(dict(server.hits))
+                server.hits.clear()
+        else:
+            break
+
+
+def mock_pool(downloader, mock_netloc, nb_conn):
+    class MockPool(downloader.ConnectionPool):
+        """Connections to the mock server, whatever the host."""
+
+        def get(self, scheme, netloc):
+            return super().get("http", mock_netloc)
+
+        def put(self, scheme, netloc, conn):
+            super().put("http", mock_netloc, conn)
+
+    return MockPool(nb_conn)
+
+
+def setup(downloader, mock_netloc, site_name, nb_conn):
+    downloader.live = 0
+    downloader.site = base_urls[site_name].split("/")[2]
+    downloader.site_profile = downloader.get_site_profile(site_name)
+    downloader.nb_conn = nb_conn
+    downloader.concurrency = downloader.ConcurrencyController(nb_conn, nb_conn, nb_conn)
+    downloader.http_pool = mock_pool(downloader, mock_netloc, nb_conn)
+    downloader.run_summary = downloader.RunSummary()
+    downloader.reset_progress()
+    downloader.reset_errors()
+
+
+def bench_pages(downloader, mock_netloc, site_name, repeat):
+    # fetch and parse the same album page, then parse it alone
+    setup(downloader, mock_netloc, site_name, 1)
+    url = base_urls[site_name] + album_paths[site_name]
+    start = time.perf_counter()
+    for _ in range(repeat):
+        downloader.site_profile.album_parser(downloader.get_page_soup(url, None))
+    pages_per_s = repeat / (time.perf_counter() - start)
+
+    (content, charset) = downloader.fetch_page(url, None)
+    start = time.perf_counter()
+    for _ in range(repeat):
+        downloader.site_profile.album_parser(BeautifulSoup(content, downloader.soup_parser,
+                                                           from_encoding=charset))
+    parse_time = (time.perf_counter() - start) / repeat
+    downloader.http_pool.close_all()
+    return pages_per_s, parse_time, len(content)
+
+
+def bench_artist(downloader, mock_netloc, site_name, nb_conn):
+    setup(downloader, mock_netloc, site_name, nb_conn)
+    base_path = tempfile.mkdtemp(prefix="bench_download_")
+    try:
+        wall = time.perf_counter()
+        cpu = time.process_time()
+        downloader.download_urls([base_urls[site_name] + artist_paths[site_name]], base_path, False)
+        cpu = time.process_time() - cpu
+        wall = time.perf_counter() - wall
+    finally:
+        downloader.http_pool.close_all()
+        shutil.rmtree(base_path)
+    return wall, cpu
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark of the downloader on a local mock server")
+    parser.add_argument("-a", "--albums", type=int, default=2, help="Number of albums of the artist")
+    parser.add_argument("-t", "--tracks", type=int, default=10, help="Number of tracks per album")
+    parser.add_argument("-s", "--size", type=int, default=4096, help="Size of the songs in KB")
+    parser.add_argument("-n", "--nb_conn", type=str, default="1,3,6",
+                        help="Numbers of connections to try, comma separated")
+    parser.add_argument("--sites", type=str, default="myzuka,musify", help="Websites, comma separated")
+    parser.add_argument("--latency", type=int, default=0, help="Server latency per request, in ms")
+    parser.add_argument("--bandwidth", type=int, default=0, help="Server bandwidth per connection, in KB/s")
+    parser.add_argument("--limit_rate", type=float, default=0,
+                        help="Part of the song requests answered with the download limit page (0 to 1)")
+    parser.add_argument("--error_rate", type=float, default=0,
+                        help="Part of all the requests answered with a 503 error (0 to 1)")
+    parser.add_argument("--albums_per_page", type=int, default=0,
+                        help="Albums per page of the artist's discography (0: all on one page)")
+    parser.add_argument("--retry_delay", type=int, default=1, help="Pause between retries, in seconds")
+    parser.add_argument("-r", "--repeat", type=int, default=50, help="Album pages fetched for pages/s")
+    args = parser.parse_args()
+
+    options = {"nb_albums": args.albums, "nb_tracks": args.tracks, "song_size": args.size * 1024,
+               "latency": args.latency / 1000, "bandwidth": args.bandwidth * 1024,
+               "limit_rate": args.limit_rate, "error_rate": args.error_rate,
+               "albums_per_page": args.albums_per_page}
+    conn, server_conn = multiprocessing.Pipe()
+    server = multiprocessing.Process(target=serve, args=(server_conn, options), daemon=True)
+    server.start()
+    mock_netloc = "127.0.0.1:%d" % conn.recv()
+
+    downloader = load_downloader()
+    downloader.retry_policy = downloader.RetryPolicy(args.retry_delay, args.retry_delay, 0, 0,
+                                                     downloader.breaker_failures, args.retry_delay)
+    # the downloader's messages would hide the results
+    downloader.console = Console(file=open(os.devnull, "w"))
+    sites = args.sites.split(",")
+
+    print("%-8s %10s %8s %12s" % ("site", "page KB", "pages/s", "parse (ms)"))
+    for site_name in sites:
+        pages_per_s, parse_time, size = bench_pages(downloader, mock_netloc, site_name, args.repeat)
+        print("%-8s %10.1f %8.1f %12.2f" % (site_name, size / 1024, pages_per_s, parse_time * 1000))
+    conn.send("hits")
+    conn.recv()
+
+    print()
+    print("%-8s %4s %8s %8s %8s %8s %12s %8s %8s" % ("site", "conn", "requests", "MB", "s",
+                                                   "MB/s", "CPU ms/MB", "limits", "errors"))
+    for site_name in sites:
+        for nb_conn in [int(n) for n in args.nb_conn.split(",")]:
+            wall, cpu = bench_artist(downloader, mock_netloc, site_name, nb_conn)
+            conn.send("hits")
+            hits = conn.recv()
+            mb = hits.get("bytes", 0) / 1024 / 1024
+            requests = sum(number for kind, number in hits.items() if kind != "bytes")
+            print("%-8s %4d %8d %8.1f %8.2f %8.1f %12.1f %8d %8d" % (site_name, nb_conn,
+                requests, mb, wall, mb / wall, cpu * 1000 / mb if mb else 0, hits.get("limit pages", 0),
+                hits.get("errors", 0)))
+
+    conn.send("stop")
+    server.join(5)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Startup time of the downloader: from the start of a new python process to its first request
+# (the album page, served by an in-process mock server, see mock_server.py), without and with the
+# live display, and the time of "--version". The live display needs a terminal, it is run in a
+# pseudo terminal (Linux, macOS).
+#
+# Usage: bench_startup.py [-r REPEAT]
+
+import os
+import sys
+import pty
+import time
+import fcntl
+import shutil
+import struct
+import termios
+import argparse
+import itertools
+import tempfile
+import threading
+import statistics
+import subprocess
+
+from common import script_path
+from mock_server import MockServer
+
+album_url = "http://myzuka.test/Album/%d/Album-%d"
+
+# runs the script like "python generic-zic-downloader.py ARGS" with all its connections going to the
+# mock server, the site is recognized from the url's domain
+bootstrap = """
+import sys
+sys.path.insert(0, %(benchmarks_dir)r)
+from common import load_downloader
+downloader = load_downloader()
+
+class MockPool(downloader.ConnectionPool):
+    def get(self, scheme, netloc):
+        return super().get("http", %(netloc)r)
+
+    def put(self, scheme, netloc, conn):
+        super().put("http", %(netloc)r, conn)
+
+downloader.ConnectionPool = MockPool
+sys.argv = [%(script_path)r] + sys.argv[1:]
+downloader.main()
+"""
+
+
+class TimedMockServer(MockServer):
+    """Mock server remembering when it received the first request for each path."""
+
+    def __init__(self):
+        super().__init__()
+        self.first_requests = {}
+
+    def recorded_page(self, path):
+        # called first for every request
+        self.first_requests.setdefault(path, time.time())
+        return super().recorded_page(path)
+
+
+def drain(fd):
+    # the live display blocks if nobody reads its terminal
+    try:
+        while os.read(fd, 65536):
+            pass
+    except OSError:
+        pass
+
+
+def first_request_time(server, live, run):
+    # seconds from the process start to the first request, each run asks for another album so that
+    # the requests of the previous (killed) process are not counted
+    netloc = "127.0.0.1:%d" % server.server_address[1]
+    code = bootstrap % {"benchmarks_dir": os.path.dirname(os.path.abspath(__file__)), "netloc": netloc,
+                        "script_path": script_path}
+    base_path = tempfile.mkdtemp(prefix="bench_startup_")
+    url = album_url % (run, run)
+    path = url.split("myzuka.test")[1]
+    command = [sys.executable, "-c", code, "-l", str(live), "-p", base_path, url]
+    master = None
+    if live:
+        master, slave = pty.openpty()
+        fcntl.ioctl(slave, termios.TIOCSWINSZ, struct.pack("HHHH", 50, 160, 0, 0))
+        output = {"stdin": slave, "stdout": slave, "stderr": slave}
+        threading.Thread(target=drain, args=(master,), daemon=True).start()
+    else:
+        output = {"stdout": subprocess.DEVNULL, "stderr": subprocess.DEVNULL}
+
+    start = time.time()
+    process = subprocess.Popen(command, **output)
+    try:
+        while path not in server.first_requests and process.poll() is None and time.time() - start < 30:
+            time.sleep(0.001)
+        if path not in server.first_requests:
+            raise RuntimeError("no request received, exit code %s" % process.poll())
+        return server.first_requests[path] - start
+    finally:
+        process.kill()
+        process.wait()
+        if master is not None:
+            os.close(slave)
+            os.close(master)
+        shutil.rmtree(base_path)
+
+
+def command_time(args):
+    start = time.perf_counter()
+    subprocess.run([sys.executable, script_path] + args, stdout=subprocess.DEVNULL, check=True)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Startup time of the downloader")
+    parser.add_argument("-r", "--repeat", type=int, default=10, help="Runs of each mode, the median is kept")
+    args = parser.parse_args()
+
+    server = TimedMockServer().start()
+    runs = itertools.count(1)
+
+    print("%-28s %10s %10s" % ("mode", "median ms", "min ms"))
+    for (name, measure) in (("--version", lambda: command_time(["--version"])),
+                            ("first request, non-live", lambda: first_request_time(server, 0, next(runs))),
+                            ("first request, live", lambda: first_request_time(server, 1, next(runs)))):
+        times = [measure() for _ in range(args.repeat)]
+        print("%-28s %10.1f %10.1f" % (name, statistics.median(times) * 1000, min(times) * 1000))
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Compare the myzuka tracks list extraction of version 6.1 (one track number regex and one
+# deleted track regex per song link, each searched on the whole page) with the one pass
+# extract_myzuka_tracks.
+#
+# Usage: bench_tracks.py [-r REPEAT] [-s SIZES] [saved_album_page.html ...]
+# Without saved pages, synthetic albums of 5, 10 and 20 tracks are used. The 6.1 regexes
+# backtrack a lot on every line break of the tracks list, expect seconds per track.
+
+import re
+import sys
+import html
+import time
+import argparse
+
+from bs4 import BeautifulSoup
+
+from common import load_downloader, read_page, myzuka_album_page
+
+# regexes of version 6.1
+re_tracknum_infos_1 = (r'<div class="position">\r?\n?'
+                       r'(?:\r?\n?)*'
+                       r'(?:\s)*')
+re_tracknum_infos_2 = (r'\r?\n?'
+                       r'(?:\r?\n?)*'
+                       r'(?:\s)*</div>\r?\n?'
+                       r'(?:\s)*<div class="options">\r?\n?'
+                       r'(?:\s)*<div class="top">\r?\n?'
+                       r'(?:\s)*<span (?:.+?)title="Сохранить в плейлист"></span>\r?\n?'
+                       r'(?:\s)*<span (?:.+?)title="Добавить в плеер"(?:.*?)>(?:.*?)</span>\r?\n?'
+                       r'(?:\s)*<a href="')
+re_link_href = r'(?P<link>/Song/.+?)"'
+re_deleted_track = (r'(?:.+?)</a>\r?\n?'
+                    r'(?:\s)*<a class=(?:.+?)</a>\r?\n?'
+                    r'(?:\s)*</div>\r?\n?'
+                    r'(?:\s)*<div class=(?:.+?)</div>\r?\n?'
+                    r'(?:\s)*</div>\r?\n?'
+                    r'(?:\s)*<div class="details">\r?\n?'
+                    r'(?:\s)*<div class="time">(?:.+?)</div>\r?\n?'
+                    r'(?:\s)*<a class=(?:.+?)<span(?:.+?)>\r?\n?'
+                    r'(?:\s)*<meta (?:.+?)/>\r?\n?'
+                    r'(?:\s)*<meta (?:.+?)/>\r?\n?'
+                    r'(?:\s)*</span>\r?\n?'
+                    r'(?:\s)*<p>\r?\n?'
+                    r'<span>(?P<title>.+?)</span>'
+                    r'(?:\s)*<span class=(?:.+?)>\[Удален по требованию правообладателя\]</span>')
+
+
+def legacy_tracks(page_soup):
+    # download_album of version 6.1, returns (position, href, deleted)
+    page_content = html.unescape(str(page_soup))
+    tracks = []
+    for link in page_soup.find_all("a", title=re.compile(r"^Скачать.*")):
+        link = str(link)
+        link_href = re.compile(re_link_href).search(link).group('link')
+        tracknum_infos_re = re.compile(re_tracknum_infos_1 + r"(?P<position>\d+)" +
+            re_tracknum_infos_2 + link_href, re.IGNORECASE)
+        tracknum_infos = tracknum_infos_re.search(page_content)
+        if not tracknum_infos:
+            continue
+        tracknum = tracknum_infos.group('position')
+        deleted_track_re = re.compile(re_tracknum_infos_1 + tracknum +
+            re_tracknum_infos_2 + link_href + '"' + re_deleted_track, re.IGNORECASE)
+        tracks.append((tracknum, link_href, bool(deleted_track_re.search(page_content))))
+    return tracks
+
+
+def best_time(function, arg, repeat):
+    best = None
+    for _ in range(repeat):
+        # the regex module caches compiled patterns, don't let it hide the compilation cost
+        re.purge()
+        start = time.perf_counter()
+        result = function(arg)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark of the myzuka tracks list extraction")
+    parser.add_argument("-r", "--repeat", type=int, default=1, help="Runs per page, the best is kept")
+    parser.add_argument("-s", "--sizes", type=str, default="5,10,20",
+                        help="Number of tracks of the synthetic albums, comma separated")
+    parser.add_argument("pages", nargs="*", help="Saved myzuka album pages")
+    args = parser.parse_args()
+
+    downloader = load_downloader()
+
+    if args.pages:
+        pages = [(path, read_page(path)) for path in args.pages]
+    else:
+        pages = [("synthetic %d tracks" % nb, myzuka_album_page(1, nb, deleted=(2, nb), filler=60000))
+                 for nb in [int(size) for size in args.sizes.split(",")]]
+
+    print("%-30s %8s %8s %12s %12s %8s" % ("page", "KB", "tracks", "6.1 (ms)", "1 pass (ms)", "speedup"))
+    for name, page in pages:
+        page_soup = BeautifulSoup(page, "html.parser")
+        legacy_time, legacy = best_time(legacy_tracks, page_soup, args.repeat)
+        new_time, tracks = best_time(downloader.extract_myzuka_tracks, page_soup, args.repeat)
+
+        if legacy != [(t.position, t.href, t.deleted) for t in tracks]:
+            print("** %s: the two extractions differ! **" % name, file=sys.stderr)
+
+        print("%-30s %8d %8d %12.2f %12.2f %7.1fx" % (name[-30:], len(page) / 1024, len(tracks),
+            legacy_time * 1000, new_time * 1000, legacy_time / new_time))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Compare the download_file transfer loop of version 6.1 (8 KiB read() and one progress update
+# per block) with copy_response (reused buffer, readinto, adaptive block size and progress
+# updated by time), on a local HTTP server running in another process.
+#
+# Usage: bench_transfer.py [-s SIZE_MB] [-r REPEAT]
+# "MB/s per core" is the size divided by the CPU time of the downloader process.
+
+import os
+import time
+import argparse
+import http.server
+import multiprocessing
+
+from common import load_downloader
+
+
+def serve(port_queue, size):
+    payload = os.urandom(1024 * 1024) * size
+
+    class Handler(http.server.BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):
+            self.send_response(200)
+            self.send_header("Content-Type", "audio/mpeg")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, *args):
+            pass
+
+    server = http.server.HTTPServer(("127.0.0.1", 0), Handler)
+    port_queue.put(server.server_address[1])
+    server.serve_forever()
+
+
+def legacy_copy(downloader, u, f, task_id):
+    # download_file loop of version 6.1
+    dlded_size = 0
+    block_sz = 8192
+    while True:
+        buffer = u.read(block_sz)
+        if not buffer:
+            break
+        else:
+            dlded_size += len(buffer)
+            f.write(buffer)
+            downloader.dl_progress.update(task_id, advance=len(buffer))
+            if downloader.event.is_set():
+                raise KeyboardInterrupt
+    return dlded_size
+
+
+def new_copy(downloader, u, f, task_id):
+    return downloader.copy_response(u, f, task_id)
+
+
+def measure(downloader, copy, url, repeat):
+    best_wall = best_cpu = None
+    for _ in range(repeat):
+        task_id = downloader.dl_progress.add_task("download", filename="bench", start=True)
+        u = downloader.http_request(url, None, None)
+        with open(os.devnull, "wb") as f:
+            wall = time.perf_counter()
+            cpu = time.process_time()
+            size = copy(downloader, u, f, task_id)
+            cpu = time.process_time() - cpu
+            wall = time.perf_counter() - wall
+        u.close()
+        best_wall = wall if best_wall is None else min(best_wall, wall)
+        best_cpu = cpu if best_cpu is None else min(best_cpu, cpu)
+    return size, best_wall, best_cpu
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark of the download_file transfer loop")
+    parser.add_argument("-s", "--size", type=int, default=200, help="Size of the file in MB")
+    parser.add_argument("-r", "--repeat", type=int, default=3, help="Runs per loop, the best is kept")
+    args = parser.parse_args()
+
+    port_queue = multiprocessing.Queue()
+    server = multiprocessing.Process(target=serve, args=(port_queue, args.size), daemon=True)
+    server.start()
+    url = "http://127.0.0.1:%s/song.mp3" % port_queue.get()
+
+    downloader = load_downloader()
+    downloader.reset_progress()
+
+    print("%-10s %10s %10s %14s" % ("loop", "MB", "MB/s", "MB/s per core"))
+    for name, copy in (("6.1", legacy_copy), ("readinto", new_copy)):
+        size, wall, cpu = measure(downloader, copy, url, args.repeat)
+        mb = size / 1024 / 1024
+        print("%-10s %10.0f %10.1f %14.1f" % (name, mb, mb / wall, mb / cpu))
+
+    server.terminate()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+
+# Helpers shared by the benchmarks: load the downloader script as a module (its name is not
+# importable) and build pages and songs with the same layout as myzuka.club and musify.club.
+
+import os
+import importlib.util
+
+script_path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                           "generic-zic-downloader.py")
+
+
+def load_downloader():
+    spec = importlib.util.spec_from_file_location("generic_zic_downloader", script_path)
+    downloader = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(downloader)
+    return downloader
+
+
+def read_page(path):
+    with open(path, encoding="utf-8") as f:
+        return f.read()
+
+
+def filler_html(size):
+    # what surrounds the tracks list on a real page (menus, comments, ads...)
+    block = '<div class="item"><a href="/Artist/1/X" title="X">X</a><span>%d</span></div>\n'
+    out = []
+    i = 0
+    while sum(len(b) for b in out) < size:
+        out.append(block % i)
+        i += 1
+    return "".join(out)
+
+
+def myzuka_album_page(album_id, nb_tracks, deleted=(), base_url="", filler=0):
+    rows = []
+    for i in range(1, nb_tracks + 1):
+        deleted_mark = ""
+        if i in deleted:
+            deleted_mark = '\n<span class="text-danger">[Удален по требованию правообладателя]</span>'
+        rows.append('''<div class="player-inline">
+<div class="position">
+%(i)d
+</div>
+<div class="options">
+<div class="top">
+<span class="glyphicon glyphicon-plus" title="Сохранить в плейлист"></span>
+<span class="glyphicon glyphicon-play" title="Добавить в плеер">play</span>
+<a href="/Song/%(album)d%(i)03d/Song-%(i)d" title="Скачать Song %(i)d">download</a>
+<a class="dl" href="/Song/%(album)d%(i)03d/Song-%(i)d">more</a>
+</div>
+<div class="data">3:21</div>
+</div>
+<div class="details">
+<div class="time">3:21</div>
+<a class="strong-link" href="/Artist/1/Foo"><span itemprop="byArtist">
+<meta content="/Artist/1/Foo" itemprop="url"/>
+<meta content="Foo" itemprop="name"/>
+</span>
+<p>
+<span>Song title %(i)d</span>%(deleted)s
+</p>
+</a>
+</div>
+</div>''' % {"i": i, "album": album_id, "deleted": deleted_mark})
+
+    return '''<html><head><meta charset="utf-8"/></head><body>
+%(filler)s
+<div class="breadcrumbs"><a href="/"><span itemprop="title">Главная</span>
+</a>/
+<span itemscope="" itemtype="http://data-vocabulary.org/Breadcrumb">Album %(album)d &amp; Co</span></div>
+<table><tr>
+<td>Исполнитель:</td>
+<td>
+<a href="/Artist/1/Foo" itemprop="byArtist">
+<meta content="/Artist/1/Foo" itemprop="url"/>
+<meta content="Foo" itemprop="name"/>
+Foo Artist
+</a>
+</td></tr></table>
+<time datetime="1994-01-01" itemprop="datePublished"></time>
+<img alt="Album %(album)d" itemprop="image" src="%(base_url)s/covers/%(album)d.jpg"/>
+%(rows)s
+%(filler)s
+</body></html>''' % {"album": album_id, "rows": "\n".join(rows), "base_url": base_url,
+                     "filler": filler_html(filler // 2)}
+
+
+def musify_album_page(album_id, nb_tracks, deleted=(), base_url="", filler=0):
+    rows = []
+    for i in range(1, nb_tracks + 1):
+        if i in deleted:
+            rows.append('''<div class="playlist__item">
+<div class="playlist__position">
+%(i)d
+</div>
+<div class="playlist__details">
+<div class="playlist__heading">
+<a href="/artist/foo-1">Foo</a> - <a href="/track/foo-song-%(i)d">Title %(i)d</a>
+<span class="badge">Недоступен</span>
+</div></div></div>''' % {"i": i})
+        else:
+            rows.append('''<div class="playlist__item" data-artist="Foo" data-position="%(i)d" data-url="/track/dl/%(album)d%(i)03d/foo-song-%(i)d.mp3" title="Слушать Song %(i)d">
+<div class="playlist__position">
+%(i)d
+</div>
+<div class="playlist__details"><div class="playlist__heading"><a href="/artist/foo-1">Foo</a> - <a href="/track/foo-song-%(i)d">Title %(i)d</a></div></div>
+</div>''' % {"i": i, "album": album_id})
+
+    return '''<html><head><meta charset="utf-8"/>
+<link href="%(base_url)s/covers/%(album)d.jpg" rel="image_src"/></head><body>
+%(filler)s
+<ol class="breadcrumb">
+<li class="breadcrumb-item"><a href="/"><span>Главная</span>
+<meta content="1" itemprop="position"/>
+</a>
+</li>
+<li class="breadcrumb-item active">Album %(album)d &amp; Co</li>
+</ol>
+<i class="zmdi zmdi-account" title="Исполнитель"></i>
+<a href="/artist/foo-1">
+<meta content="/artist/foo-1" itemprop="url"/>
+<meta content="Foo" itemprop="name"/>
+Foo Artist
+</a>
+<time datetime="2001-01-01" itemprop="datePublished"></time>
+%(rows)s
+%(filler)s
+</body></html>''' % {"album": album_id, "rows": "\n".join(rows), "base_url": base_url,
+                     "filler": filler_html(filler // 2)}
+
+
+def myzuka_artist_page(album_ids, nb_pages=1, artist_path="/Artist/1/Foo"):
+    # each album is linked twice (cover and title), like on the website, and the pager links to
+    # every page of the discography
+    links = ['<a href="/Album/%d/Album-%d">a</a><a href="/Album/%d/Album-%d">b</a>' % (i, i, i, i)
+             for i in album_ids]
+    links += ['<a href="%s/Albums/Page%d">%d</a>' % (artist_path, n, n) for n in range(2, nb_pages + 1)]
+    return "<html><body>%s</body></html>" % "\n".join(links)
+
+
+def musify_artist_page(album_ids, nb_pages=1, artist_path="/artist/foo-1"):
+    links = ['<a href="/release/foo-album-%d">a</a><a href="/release/foo-album-%d">b</a>' % (i, i)
+             for i in album_ids]
+    links += ['<a href="%s/releases?page=%d">%d</a>' % (artist_path, n, n) for n in range(2, nb_pages + 1)]
+    return "<html><body>%s</body></html>" % "\n".join(links)
+
+
+def myzuka_song_page(song_id):
+    return ('<html><body><a class="no-ajaxy" href="/File/%d.mp3" itemprop="audio">Скачать</a>'
+            '</body></html>' % song_id)
+
+
+def limit_page():
+    # what the websites serve instead of the song when we download too much
+    return ('<html><head><meta charset="utf-8"/></head><body><h1>Превышение лимита скачивания</h1>'
+            '</body></html>')
+
+
+def mp3_payload(song_id, size):
+    # MPEG-1 layer III frames (128 kbps, 44.1 kHz, 417 bytes) whose content depends on the song
+    frame = b"\xff\xfb\x90\x64" + bytes([song_id % 251]) * 413
+    return frame * max(1, size // len(frame))
@@ -0,0 +1,255 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Local HTTP server mimicking myzuka.club and musify.club, to run the downloader without hitting
+# the websites. Both layouts are served at the same time:
+#   myzuka: /Artist/1/Foo, /Artist/1/Foo/Albums/PageN, /Album/N/..., /Song/ID/... (page with the file
+#           link), /File/ID.mp3
+#   musify: /artist/foo-1, /artist/foo-1/releases?page=N, /release/foo-album-N, /track/dl/ID/name.mp3
+#   covers: /covers/N.jpg
+# Myzuka files support Range requests (206), musify ones are always sent in full like on the
+# website. The server can add a latency to every request, throttle each connection, answer a part
+# of the file requests with the small "download limit exceeded" page and a part of all the
+# requests with a 503 error. The discography can be split in pages of --albums_per_page albums,
+# and the first --shared_songs songs of every album can be the same as album 1's (compilations).
+# A part of the songs can be sent corrupted, with zeros instead of their frames in the middle.
+#
+# Recorded pages can be served instead of the synthetic ones with --pages DIR: a request for
+# /Album/630746/Foo is answered with DIR/Album_630746_Foo.html if this file exists.
+#
+# Usage: mock_server.py [-p PORT] [-a ALBUMS] [-t TRACKS] [-s SIZE_KB] [--latency MS]
+#                       [--bandwidth KB/s] [--limit_rate RATE] [--error_rate RATE] [--pages DIR]
+#                       [--albums_per_page N] [--shared_songs N] [--corrupt_rate RATE]
+# The downloader recognizes the website from its domain, so add for example
+# "127.0.0.1 myzuka.test musify.test" to your hosts file and run:
+#   generic-zic-downloader.py http://myzuka.test:8765/Artist/1/Foo
+
+import os
+import re
+import sys
+import time
+import random
+import argparse
+import threading
+import collections
+import http.server
+
+from common import (myzuka_album_page, musify_album_page, myzuka_artist_page, musify_artist_page,
+                    myzuka_song_page, limit_page, mp3_payload)
+
+cover_payload = b"\xff\xd8\xff\xe0" + b"c" * 20000
+
+
+class MockHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # the headers and the body are written separately, don't let them wait for a delayed ACK
+    disable_nagle_algorithm = True
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        # the artist pages are fetched with a POST
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        self.do_GET()
+
+    def do_GET(self):
+        server = self.server
+        (path, _, query) = self.path.partition("?")
+        if server.latency:
+            time.sleep(server.latency)
+        if server.draw(server.error_rate):
+            server.count("errors")
+            return self.send(503, b"<html><body>Service Unavailable</body></html>")
+
+        recorded = server.recorded_page(path)
+        if recorded is not None:
+            server.count("pages")
+            return self.send(200, recorded)
+
+        m = re.match(r"^/Album/(\d+)", path)
+        if m:
+            server.count("pages")
+            return self.send(200, myzuka_album_page(int(m.group(1)), server.nb_tracks, server.deleted,
+                                                    server.base_url(self)).encode())
+        m = re.match(r"^/release/.+-(\d+)$", path)
+        if m:
+            server.count("pages")
+            return self.send(200, musify_album_page(int(m.group(1)), server.nb_tracks, server.deleted,
+                                                    server.base_url(self)).encode())
+        m = re.match(r"^(/Artist/\d+/[^/]+)(?:/Albums/Page(\d+))?", path)
+        if m:
+            server.count("pages")
+            page = int(m.group(2) or 1)
+            return self.send(200, myzuka_artist_page(server.artist_page(page), server.nb_artist_pages(),
+                                                     m.group(1)).encode())
+        m = re.match(r"^(/artist/[^/]+)(?:/releases)?", path)
+        if m:
+            server.count("pages")
+            page = re.search(r"page=(\d+)", query)
+            page = int(page.group(1)) if page else 1
+            return self.send(200, musify_artist_page(server.artist_page(page), server.nb_artist_pages(),
+                                                     m.group(1)).encode())
+        m = re.match(r"^/Song/(\d+)/", path)
+        if m:
+            server.count("song pages")
+            return self.send(200, myzuka_song_page(int(m.group(1))).encode())
+        if path.startswith("/covers/"):
+            server.count("covers")
+            return self.send(200, cover_payload, "image/jpeg")
+
+        m = re.match(r"^/File/(\d+)\.mp3$", path)
+        if m:
+            song_id = int(m.group(1))
+            file_name = "%02d_foo_song_%d_myzuka.mp3" % (song_id % 1000, song_id)
+            return self.send_song(song_id, file_name, True)
+        m = re.match(r"^/track/dl/(\d+)/(.+\.mp3)$", path)
+        if m:
+            return self.send_song(int(m.group(1)), m.group(2), False)
+
+        self.send(404, b"<html><body>Not found</body></html>")
+
+    def send_song(self, song_id, file_name, range_support):
+        server = self.server
+        if server.draw(server.limit_rate):
+            server.count("limit pages")
+            return self.send(200, limit_page().encode())
+
+        server.count("songs")
+        if song_id % 1000 <= server.shared_songs:
+            # the same song as on album 1
+            song_id = 1000 + song_id % 1000
+        payload = mp3_payload(song_id, server.song_size)
+        if server.draw(server.corrupt_rate):
+            server.count("corrupted songs")
+            middle = len(payload) // 2
+            payload = payload[:middle] + bytes(min(32768, len(payload) - middle)) + payload[middle + 32768:]
+        headers = [("Content-Disposition", "attachment; filename=" + file_name),
+                   ("Accept-Ranges", "bytes" if range_support else "none")]
+        range_header = self.headers.get("Range")
+        m = re.match(r"^bytes=(\d+)-(\d*)$", range_header or "")
+        if range_support and m:
+            start = int(m.group(1))
+            end = min(int(m.group(2)) if m.group(2) else len(payload) - 1, len(payload) - 1)
+            headers.append(("Content-Range", "bytes %d-%d/%d" % (start, end, len(payload))))
+            return self.send(206, payload[start:end + 1], "audio/mpeg", headers)
+        self.send(200, payload, "audio/mpeg", headers)
+
+    def send(self, code, body, content_type="text/html; charset=utf-8", headers=()):
+        self.send_response(code)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for (name, value) in headers:
+            self.send_header(name, value)
+        self.end_headers()
+        if self.command == "HEAD":
+            return
+        self.server.count("bytes", len(body))
+
+        if not self.server.bandwidth:
+            self.wfile.write(body)
+            return
+        # throttled connection: one block every 1/10 second
+        block_size = max(1, self.server.bandwidth // 10)
+        for i in range(0, len(body), block_size):
+            self.wfile.write(body[i:i + block_size])
+            time.sleep(0.1)
+
+
+class MockServer(http.server.ThreadingHTTPServer):
+    """Both websites on one local port, with the requests counted by kind."""
+
+    daemon_threads = True
+
+    def __init__(self, port=0, nb_albums=2, nb_tracks=10, song_size=2 * 1024 * 1024, deleted=(3,),
+                 latency=0, bandwidth=0, limit_rate=0, error_rate=0, pages_dir=None, seed=0,
+                 albums_per_page=0, shared_songs=0, corrupt_rate=0):
+        super().__init__(("127.0.0.1", port), MockHandler)
+        self.album_ids = list(range(1, nb_albums + 1))
+        self.nb_tracks = nb_tracks
+        self.song_size = song_size
+        self.deleted = deleted
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.limit_rate = limit_rate
+        self.error_rate = error_rate
+        self.pages_dir = pages_dir
+        self.albums_per_page = albums_per_page or max(1, nb_albums)
+        self.shared_songs = shared_songs
+        self.corrupt_rate = corrupt_rate
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.hits = collections.Counter()
+
+    def handle_error(self, request, client_address):
+        # the downloader resets the connections it closes with unread data (download limit pages)
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+    def base_url(self, handler):
+        # absolute urls (covers) must use the name the client used
+        return "http://" + (handler.headers.get("Host") or "127.0.0.1:%d" % self.server_address[1])
+
+    def count(self, kind, number=1):
+        with self.lock:
+            self.hits[kind] += number
+
+    def draw(self, rate):
+        with self.lock:
+            return self.random.random() < rate
+
+    def nb_artist_pages(self):
+        return max(1, -(-len(self.album_ids) // self.albums_per_page))
+
+    def artist_page(self, page):
+        # album ids of a page of the discography, from 1
+        return self.album_ids[(page - 1) * self.albums_per_page:page * self.albums_per_page]
+
+    def recorded_page(self, path):
+        if not self.pages_dir:
+            return None
+        file_path = os.path.join(self.pages_dir, path.strip("/").replace("/", "_") + ".html")
+        if not os.path.isfile(file_path):
+            return None
+        with open(file_path, "rb") as f:
+            return f.read()
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local server mimicking myzuka.club and musify.club")
+    parser.add_argument("-p", "--port", type=int, default=8765, help="Port to listen on (127.0.0.1)")
+    parser.add_argument("-a", "--albums", type=int, default=2, help="Number of albums of the artist")
+    parser.add_argument("-t", "--tracks", type=int, default=10, help="Number of tracks per album")
+    parser.add_argument("-s", "--size", type=int, default=2048, help="Size of the songs in KB")
+    parser.add_argument("--latency", type=int, default=0, help="Added to every request, in ms")
+    parser.add_argument("--bandwidth", type=int, default=0, help="Per connection, in KB/s (0: unlimited)")
+    parser.add_argument("--limit_rate", type=float, default=0,
+                        help="Part of the song requests answered with the download limit page (0 to 1)")
+    parser.add_argument("--error_rate", type=float, default=0,
+                        help="Part of all the requests answered with a 503 error (0 to 1)")
+    parser.add_argument("--pages", type=str, default=None, help="Directory of recorded pages")
+    parser.add_argument("--albums_per_page", type=int, default=0,
+                        help="Albums per page of the artist's discography (0: all on one page)")
+    parser.add_argument("--shared_songs", type=int, default=0,
+                        help="Number of songs at the start of every album with the same content as album 1's")
+    parser.add_argument("--corrupt_rate", type=float, default=0,
+                        help="Part of the songs sent with zeros instead of their frames in the middle (0 to 1)")
+    args = parser.parse_args()
+
+    server = MockServer(args.port, args.albums, args.tracks, args.size * 1024, latency=args.latency / 1000,
+                        bandwidth=args.bandwidth * 1024, limit_rate=args.limit_rate,
+                        error_rate=args.error_rate, pages_dir=args.pages, albums_per_page=args.albums_per_page,
+                        shared_songs=args.shared_songs, corrupt_rate=args.corrupt_rate)
+    print("Serving on http://127.0.0.1:%d, ctrl-c to stop" % server.server_address[1])
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print(dict(server.hits))
+
+
+if __name__ == "__main__":
+    main()
@@ -18,11 +18,15 @@
 #      "urllib.request", because cloudflare seems to block more "urllib.request" than "requests",
 #      even with the same headers...
 
+# the annotations name rich classes which are only imported with the live display
+from __future__ import annotations
+
 live = 1
 site = ""
 version = 6.1
 useragent = "Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:126.0) Gecko/20100101 Firefox/126.0"
 min_page_size = 8192
+max_resync = 8192 # bytes between two MP3 frames before a song is considered corrupted
 covers_name = "cover.jpg"
 warning_color = "bold yellow"
 error_color = "bold red"
@@ -32,44 +36,63 @@ debug_color = "bold blue"
 socks_proxy = ""
 socks_port = ""
 timeout = 10
-min_retry_delay = 5
-max_retry_delay = 10
+retry_base_delay = 2 # seconds, doubled at each failure of the same url
+retry_max_delay = 120
+max_retries = 10 # per url
+max_host_retries = 500 # per host, in host_retries_window
+host_retries_window = 3600 # seconds
+breaker_failures = 5 # consecutive failures on a host before pausing it
+breaker_pause = 60
+max_redirects = 10
+max_artist_pages = 200 # pages of an artist's discography explored to find its albums
 nb_conn = 3
+verify = 0
+cache_ttl = 3600
+cache_size = 50 # MB
+metrics_interval = 15 # seconds between two writes of --metrics_file
+segments = 1
+dedupe_prefix_size = 64 * 1024 # first bytes of a song hashed to find it in the other albums (--dedupe)
+nb_resolvers = 2 # song pages (myzuka) resolved at the same time, ahead of the transfers
+stream = None # --stream: "-" (stdout), or the path of a file or a named pipe
+stream_fifo = False # --fifo: create the named pipe
+stream_output = None
+read_ahead = 3 # songs downloaded ahead of the one being streamed
+stream_buffer_size = 8 * 1024 * 1024 # bytes of each streamed song kept in memory
+segment_min_size = 1024 * 1024
+min_block_size = 64 * 1024
+max_block_size = 1024 * 1024
+block_read_time = 0.1 # target time for one read in the transfers, see copy_response
+progress_interval = 0.25
+live_refresh = 4 # per second, the live display and its events
 log = 0
 max_rows = 0
 nb_rows = 0
 warn_size = 1
 
-# Regexes
-re_artist_url = ""
-re_album_url = ""
-re_album_id = ""
-re_cover_url = ""
-re_tracknum_infos_1 = ""
-re_tracknum_infos_2 = ""
-re_deleted_track = ""
-re_artist_info = ""
-re_title_info = ""
-re_link_attr = ""
-re_link_keyword = ""
-re_link_href = ""
+site_profile = None
 
 import re
 import sys
 import os
+import stat
+import errno
 import time
 import math
+import shutil
 import random
-import socks
 import socket
-import html
 import argparse
+import collections
+import queue
+import contextlib
 import traceback
 import signal
+import http.client
+import urllib.error
+import urllib.parse
 import urllib.request
-from bs4 import BeautifulSoup
 from datetime import datetime
-from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import Future, ThreadPoolExecutor
 import threading
 
 # kill this script with SIGABRT in case of deadlock to see the stacktrace.
@@ -77,31 +100,15 @@ import faulthandler
 faulthandler.enable()
 
 ## Rich definitions ##
-from rich.table import Table
-from rich.layout import Layout
-from rich.panel import Panel
-from rich.live import Live
-from rich.console import Console
-from rich import box
-#from rich.text import Text
-#from rich.align import Align
-
-# from rich import inspect
+# rich is imported when it is used: the live display imports its widgets with load_live_ui(),
+# without it the messages only need a Console (get_console) and the downloads progress is kept
+# in a TaskProgress.
+
 # Rich can be installed as the default traceback handler so that all 
 # uncaught exceptions will be rendered with highlighting.
 # from rich.traceback import install
 # install()
 
-from rich.progress import (
-    BarColumn,
-    DownloadColumn,
-    TextColumn,
-    TransferSpeedColumn,
-    TimeRemainingColumn,
-    Progress,
-    TaskID,
-)
-
 
 class Header:
     """Display header with clock."""
@@ -114,6 +121,7 @@ class Header:
             "[b]Music[/b] downloader v%s, use Ctrl-c to exit or close the terminal" % version,
             datetime.now().ctime().replace(":", "[blink]:[/]"),
         )
+        grid.add_row(rate_limiter.report(), "")
         return Panel(grid, style="white on black")
 
 
@@ -122,7 +130,7 @@ def make_layout() -> Layout:
     layout = Layout(name="root")
 
     layout.split(
-        Layout(name="header", size=3),
+        Layout(name="header", size=4),
         Layout(name="main", ratio=1),
     )
     layout["main"].split_row(
@@ -133,24 +141,108 @@ def make_layout() -> Layout:
     return layout
 
 
-layout = make_layout()
-console = Console()
-infos_table = Table(show_header=False, box=box.SIMPLE)
-errors_table = Table(show_header=False, box=box.SIMPLE)
-#errors_console = Console()
-#errors_text = Text()
-progress_table = Table.grid(expand=True)
-dl_progress = Progress()
+layout = None
+console = None
+infos_table = None
+errors_table = None
+progress_table = None
+dl_progress = None
+
+
+def load_live_ui():
+    # import the widgets of the live display and build it, once
+    global Table, Layout, Panel, Live, box, Progress, layout, infos_table, errors_table
+    if layout is not None:
+        return
+    from rich.table import Table
+    from rich.layout import Layout
+    from rich.panel import Panel
+    from rich.live import Live
+    from rich.progress import Progress
+    from rich import box
+    layout = make_layout()
+    infos_table = Table(show_header=False, box=box.SIMPLE)
+    errors_table = Table(show_header=False, box=box.SIMPLE)
+
+
+def get_console():
+    global console
+    if console is None:
+        from rich.console import Console
+        # stdout may be the --stream
+        console = Console(stderr=(stream == "-"))
+    return console
+
+
+class ProgressTask:
+    """The fields of a rich progress Task used by the downloader."""
+
+    def __init__(self, task_id, total, fields):
+        self.id = task_id
+        self.total = total
+        self.completed = 0
+        self.fields = fields
+
+
+class TaskProgress:
+    """What the downloads use of rich's Progress, without display, for the runs without live display."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.next_id = 0
+        self._tasks = collections.OrderedDict()
+
+    def add_task(self, description, start=True, total=100.0, **fields):
+        with self.lock:
+            task_id = self.next_id
+            self.next_id += 1
+            self._tasks[task_id] = ProgressTask(task_id, total, fields)
+        return task_id
+
+    def start_task(self, task_id):
+        pass
+
+    def update(self, task_id, total=None, completed=None, advance=None, **fields):
+        with self.lock:
+            task = self._tasks[task_id]
+            if total is not None:
+                task.total = total
+            if completed is not None:
+                task.completed = completed
+            if advance is not None:
+                task.completed += advance
+            task.fields.update(fields)
+
+    def reset(self, task_id, start=True, total=None, completed=0, **fields):
+        self.update(task_id, total=total, completed=completed, **fields)
+
+    def remove_task(self, task_id):
+        with self.lock:
+            del self._tasks[task_id]
+
+    @property
+    def tasks(self):
+        with self.lock:
+            return list(self._tasks.values())
 
 
 def reset_errors():
     global errors_table
+    if not live:
+        return
+    load_live_ui()
     errors_table = Table(show_header=False, box=box.SIMPLE)
     #layout["right"].update(Panel(errors_table))
 
 
 def reset_progress():
     global dl_progress
+    if not live:
+        dl_progress = TaskProgress()
+        return
+
+    load_live_ui()
+    from rich.progress import BarColumn, DownloadColumn, TextColumn, TransferSpeedColumn, TimeRemainingColumn
     dl_progress = Progress(
         TextColumn("[bold blue]{task.fields[filename]}", justify="right"),
         BarColumn(bar_width=None),
@@ -177,17 +269,354 @@ def reset_progress():
 ## END OF Rich definitions ##
 
 
+## Live display events ##
+class UIEvents:
+    """Progress and messages of the worker threads, applied to the live display by its own thread.
+
+    The display thread takes the events posted by the workers live_refresh times per second,
+    and reads the terminal size once for all the messages. The advances of a task are added
+    up as they are posted, so they don't pile up when the display falls behind; the other
+    events (start, reset, removal of a task, messages) are all kept, in order.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.events = []
+        # {task_id: advance} posted since the last event of the task
+        self.advances = {}
+        self.running = False
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def progress(self, method, task_id, **fields):
+        # method of dl_progress: update, start_task, reset or remove_task
+        with self.lock:
+            if method == "update" and list(fields) == ["advance"]:
+                self.advances[task_id] = self.advances.get(task_id, 0) + fields["advance"]
+                return
+            # the advances come before the other changes of their task
+            advance = self.advances.pop(task_id, None)
+            if advance is not None:
+                self.events.append(("progress", "update", task_id, {"advance": advance}))
+            self.events.append(("progress", method, task_id, fields))
+
+    def message(self, msg, color):
+        with self.lock:
+            self.events.append(("message", msg, color))
+
+    def info(self, row):
+        with self.lock:
+            self.events.append(("info", row))
+
+    def start(self):
+        self.running = True
+        self.stopped.clear()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        # the events posted from now on are applied directly, the last ones posted before
+        # are applied once the display thread is done
+        self.running = False
+        self.stopped.set()
+        self.thread.join()
+        self.apply()
+
+    def run(self):
+        while not self.stopped.wait(1 / live_refresh):
+            self.apply()
+        self.apply()
+
+    def apply(self):
+        with self.lock:
+            (events, self.events) = (self.events, [])
+            (advances, self.advances) = (self.advances, {})
+        messages = []
+        infos = []
+        for ui_event in events:
+            if ui_event[0] == "message":
+                messages.append(ui_event[1:])
+            elif ui_event[0] == "info":
+                infos.append(ui_event[1])
+            else:
+                (_, method, task_id, fields) = ui_event
+                self.apply_progress(method, task_id, **fields)
+
+        for (task_id, advance) in advances.items():
+            self.apply_progress("update", task_id, advance=advance)
+        if infos:
+            show_infos(infos)
+        if messages:
+            show_messages(messages)
+
+    def apply_progress(self, method, task_id, **fields):
+        try:
+            getattr(dl_progress, method)(task_id, **fields)
+        except KeyError:
+            # task already removed
+            pass
+
+
+ui_events = UIEvents()
+
+
+def update_progress(method, task_id, **fields):
+    # change a task of dl_progress, through the live display thread when it runs
+    if ui_events.running:
+        ui_events.progress(method, task_id, **fields)
+    else:
+        getattr(dl_progress, method)(task_id, **fields)
+
+## End of Live display events ##
+
+
 ## Thread event definition ## 
 event = threading.Event()
+# the daemon's running job is cancelled, the process goes on (DaemonJob.cancel_event)
+cancel_event = threading.Event()
 
 # "event" not being global, we need to define this function in this scope
 def signal_handler(signum, frame):
     event.set()
     color_message("SIGINT received, waiting to exit threads", error_color)
 
+
+def stopping():
+    # the downloads stop on ctrl-c, or when the daemon's job is cancelled
+    return event.is_set() or cancel_event.is_set()
+
+
+def wait_stopping(seconds):
+    # pause of a download, True as soon as it has to stop
+    end = time.monotonic() + seconds
+    while not stopping():
+        remaining = end - time.monotonic()
+        if remaining <= 0:
+            return False
+        event.wait(min(remaining, 0.5))
+    return True
+
 ## End of Thread event definition ## 
 
 
+## Site profiles ##
+class SiteProfile:
+    """What differs between the supported websites, all the regexes are compiled once here.
+
+    To support another website, add a profile in site_profiles.
+    """
+
+    def __init__(self, name, artist_url, album_url, album_id, artist_id, artist_pages, album_parser,
+                 song_page, file_name_from_url, resume):
+        # name must be in the website domain
+        self.name = name
+        # classify given urls
+        self.artist_url = artist_url
+        self.album_url = album_url
+        self.artist_url_re = re.compile(artist_url, re.IGNORECASE)
+        self.album_url_re = re.compile(album_url, re.IGNORECASE)
+        # albums links on the artist's page
+        self.album_link_re = re.compile(album_url)
+        self.album_id_re = re.compile(album_id)
+        # the artist of an artist url, and the links to the other pages of its discography
+        # (pagination, categories), followed if they are of the same artist
+        self.artist_id_re = re.compile(artist_id)
+        self.artist_pages_re = re.compile(artist_pages)
+        # function giving the AlbumPage of an album's page soup
+        self.album_parser = album_parser
+        # the songs links go to a page with the file link instead of the file itself
+        self.song_page = song_page
+        # take the song's file name from the url instead of the content-disposition header
+        self.file_name_from_url = file_name_from_url
+        # the server supports resuming downloads with a Range header
+        self.resume = resume
+
+    def is_artist_url(self, url):
+        return bool(self.artist_url_re.search(url))
+
+    def is_album_url(self, url):
+        return bool(self.album_url_re.search(url))
+
+    def get_album_id(self, url):
+        m = self.album_id_re.search(url)
+        return m.group(1) if m else None
+
+    def get_artist_id(self, url):
+        m = self.artist_id_re.search(url)
+        return m.group(1) if m else None
+
+    def is_artist_page(self, url, artist_id):
+        return bool(self.artist_pages_re.search(url)) and self.get_artist_id(url) == artist_id
+
+    def get_file_name(self, url, server_file_name):
+        if self.file_name_from_url:
+            return urllib.request.url2pathname(url.split("/")[-1])
+        return server_file_name.replace("_" + self.name, "")
+
+
+# Everything we need from an album's page, read directly from its soup
+AlbumPage = collections.namedtuple("AlbumPage", ["artist", "title", "year", "cover_url", "tracks",
+                                                 "deleted_tracks"])
+Track = collections.namedtuple("Track", ["position", "href", "deleted", "title"])
+
+year_re = re.compile(r"^(\d+)")
+
+
+def get_text(tag):
+    return tag.get_text(" ", strip=True) if tag else ""
+
+
+def get_year(page_soup):
+    # <time datetime="1994-01-01" itemprop="datePublished"></time>
+    time_tag = page_soup.find("time", itemprop="datePublished", datetime=True)
+    year_match = year_re.match(time_tag["datetime"]) if time_tag else None
+    return year_match.group(1) if year_match else ""
+
+
+myzuka_song_href_re = re.compile(r"^/Song/")
+myzuka_deleted_mark = "[Удален по требованию правообладателя]"
+
+
+def extract_myzuka_tracks(page_soup):
+    # One pass on the album's tracks list: each track row has a "position" div, the song link
+    # and the title, followed by a mark if the track has been deleted:
+    # <div class="position">1</div>
+    # <div class="options"><div class="top">...<a href="/Song/...">...</div>...</div>
+    # <div class="details">...<p><span>Title</span><span class="...">[Удален ...]</span></p></div>
+    tracks = []
+    for position_div in page_soup.find_all("div", class_="position"):
+        position = position_div.get_text(strip=True)
+        row = position_div.parent
+        link = row.find("a", href=myzuka_song_href_re)
+        if not position.isdigit() or not link:
+            # not a track row
+            continue
+
+        title = ""
+        details = row.find("div", class_="details")
+        if details and details.p and details.p.span:
+            title = details.p.span.get_text(strip=True)
+
+        deleted = any(myzuka_deleted_mark in span.get_text() for span in row.find_all("span"))
+        tracks.append(Track(position, link["href"], deleted, title))
+    return tracks
+
+
+def parse_myzuka_album(page_soup):
+    # <td>Исполнитель:</td><td><a ...><meta itemprop="url"/><meta itemprop="name"/>Artist</a></td>
+    artist = ""
+    artist_td = page_soup.find("td", string=re.compile(r"^\s*Исполнитель:\s*$"))
+    if artist_td:
+        artist_cell = artist_td.find_next_sibling("td")
+        artist = get_text(artist_cell.a if artist_cell else None)
+
+    # the album is the last breadcrumb, the only one without a link:
+    # <span itemtype="http://data-vocabulary.org/Breadcrumb">Album</span>
+    title = ""
+    for breadcrumb in page_soup.find_all("span", itemtype="http://data-vocabulary.org/Breadcrumb"):
+        if not breadcrumb.find("a"):
+            title = get_text(breadcrumb)
+
+    cover = page_soup.find("img", itemprop="image", src=True)
+
+    with metrics.phase("track extraction"):
+        tracks = extract_myzuka_tracks(page_soup)
+    return AlbumPage(artist, title, get_year(page_soup), cover["src"] if cover else "",
+                     [track for track in tracks if not track.deleted],
+                     [track for track in tracks if track.deleted])
+
+
+musify_link_title_re = re.compile(r"^Слушать")
+musify_deleted_mark = "Недоступен"
+
+
+def parse_musify_album(page_soup):
+    # <i title="Исполнитель"></i><a ...><meta itemprop="url"/><meta itemprop="name"/>Artist</a>
+    artist = ""
+    artist_icon = page_soup.find("i", title="Исполнитель")
+    if artist_icon:
+        artist = get_text(artist_icon.find_next("a"))
+
+    # <li class="breadcrumb-item active">Album</li>
+    title = get_text(page_soup.select_one("li.breadcrumb-item.active"))
+
+    cover = page_soup.find("link", rel="image_src", href=True)
+
+    with metrics.phase("track extraction"):
+        (tracks, deleted_tracks) = extract_musify_tracks(page_soup)
+    return AlbumPage(artist, title, get_year(page_soup), cover["href"] if cover else "",
+                     tracks, deleted_tracks)
+
+
+def extract_musify_tracks(page_soup):
+    # the available tracks are the "listen" divs, with their position and file url
+    # <div data-position="1" data-url="/track/dl/.../song.mp3" title="Слушать ...">
+    tracks = []
+    for link in page_soup.find_all("div", title=musify_link_title_re):
+        position = link.get("data-position", "")
+        href = link.get("data-url", "")
+        if not position.isdigit() or not href.endswith(".mp3"):
+            color_message("** Unable to get number %s for %s **" % (position, href), warning_color)
+            continue
+        tracks.append(Track(position, href, False, get_text(link.find(class_="playlist__heading"))))
+
+    # deleted tracks have no "listen" div, only a mark in their heading:
+    # <div class="playlist__position">3</div>
+    # <div class="playlist__details"><div class="playlist__heading"><a>Artist</a> - <a>Title</a>
+    # <span>Недоступен</span></div></div>
+    deleted_tracks = []
+    for position_div in page_soup.find_all("div", class_="playlist__position"):
+        details = position_div.find_next_sibling("div", class_="playlist__details")
+        heading = details.find("div", class_="playlist__heading") if details else None
+        if heading and heading.find("span", string=re.compile(musify_deleted_mark)):
+            links = heading.find_all("a")
+            deleted_tracks.append(Track(position_div.get_text(strip=True), "", True,
+                                        get_text(links[-1]) if links else ""))
+    return (tracks, deleted_tracks)
+
+
+myzuka_profile = SiteProfile(
+    name="myzuka",
+    artist_url=r"/Artist/.*",
+    album_url=r"/Album/.*",
+    album_id=r"Album/(\d+)",
+    artist_id=r"/Artist/(\d+)",
+    # /Artist/7110/Johann-Sebastian-Bach/Albums/Page2
+    artist_pages=r"/Artist/\d+/[^/?#]+/Albums(/[^#]*)?$",
+    album_parser=parse_myzuka_album,
+    song_page=True,
+    file_name_from_url=False,
+    resume=True,
+)
+
+musify_profile = SiteProfile(
+    name="musify",
+    artist_url=r"/artist/.*",
+    album_url=r"/release/.*",
+    album_id=r"release/.+-(\d+)",
+    artist_id=r"/artist/([^/?#]+)",
+    # /artist/leningrad-1/releases?page=2
+    artist_pages=r"/artist/[^/?#]+/releases([/?][^#]*)?$",
+    album_parser=parse_musify_album,
+    song_page=False,
+    file_name_from_url=True,
+    # musify does not correctly support this, there is a mismatch in byte offset that create shorters
+    # and corrupted downloaded files. Even "curl" has the same problem while resuming downloads on musify.
+    resume=False,
+)
+
+site_profiles = [myzuka_profile, musify_profile]
+
+
+def get_site_profile(domain):
+    for profile in site_profiles:
+        if profile.name in domain:
+            return profile
+    return None
+
+## End of Site profiles ##
+
+
 def script_help():
     description = "Python script to download albums from myzuka.club or musify.club, version %.2f." % (version)
     help_string = (description + """
@@ -247,6 +676,50 @@ cover.jpg                                                 00.01 of 00.01 MB [100
 
 It will iterate on all albums of this artist.
 
+------------------------------------------------------------------------------------------------------------------
+##### To skip the albums already downloaded when running it again, record them in a state database ###############
+------------------------------------------------------------------------------------------------------------------
+
+user@computer:/tmp$ %s [-p /path] --state_db https://myzuka.club/Artist/7110/Johann-Sebastian-Bach/Albums
+
+The completed albums and songs are recorded in .generic-zic-downloader.db in the download path (or in the
+file given to --state_db_path), the next runs skip them without connecting to the website. --verify checks
+them again. No database is used by default, except with --dedupe.
+
+------------------------------------------------------------------------------------------------------------------
+##### To download many artists and albums, from both websites, list their urls in a file (one per line) #########
+------------------------------------------------------------------------------------------------------------------
+
+user@computer:/tmp$ %s [-p /path] --url_file urls.txt   (or "--url_file -" for stdin)
+
+They all share the same simultaneous downloads, an album linked from several artists is downloaded once,
+and a summary of the finished, incomplete and failed albums is given at the end.
+
+------------------------------------------------------------------------------------------------------------------
+##### To keep it running and submit downloads from other programs, use the daemon mode ##########################
+------------------------------------------------------------------------------------------------------------------
+
+user@computer:/tmp$ %s [-p /path] --daemon 8700 [urls of a first job]
+user@computer:/tmp$ curl -X POST localhost:8700/jobs -d '{"urls": ["https://myzuka.club/Album/630746"]}'
+user@computer:/tmp$ curl localhost:8700/jobs            (all the jobs and their albums counts)
+user@computer:/tmp$ curl localhost:8700/jobs/1          (albums and tracks progress of job 1)
+user@computer:/tmp$ curl -X DELETE localhost:8700/jobs/1   (cancel job 1)
+user@computer:/tmp$ curl localhost:8700/metrics         (connections, requests and bytes per host, cache hits)
+user@computer:/tmp$ curl localhost:8700/metrics/prometheus   (totals of --metrics_file)
+
+The jobs are downloaded one after the other, the API only listens on 127.0.0.1.
+
+------------------------------------------------------------------------------------------------------------------
+##### To listen to the albums while they download, stream them to a player #######################################
+------------------------------------------------------------------------------------------------------------------
+
+user@computer:/tmp$ %s --stream - https://myzuka.club/Album/630746 | mpv -
+user@computer:/tmp$ %s --stream /tmp/music.fifo --fifo https://myzuka.club/Album/630746
+user@computer:/tmp$ mpv /tmp/music.fifo        (in another terminal)
+
+The songs are written in the album's order, without being saved. The next ones (--read_ahead)
+are downloaded while the current one plays, with a few MB of each in memory.
+
 ------------------------------------------------------------------------------------------------------------------
 ################# Command line help ##############################################################################
 ------------------------------------------------------------------------------------------------------------------
@@ -254,15 +727,11 @@ It will iterate on all albums of this artist.
 For more info, see https://github.com/damsgithub/%s
 
 """
-        % (script_name, script_name, script_name)
+        % (script_name, script_name, script_name, script_name, script_name, script_name, script_name, script_name)
     )
     return help_string
 
 
-def pause_between_retries():
-    time.sleep(random.randint(min_retry_delay, max_retry_delay))
-
-
 def to_MB(a_bytes):
     return a_bytes / 1024.0 / 1024.0
 
@@ -277,26 +746,39 @@ def log_to_file(function, content):
 
 def color_message(msg, color):
     if live:
-        global nb_rows
-        global warn_size
-        # Text test
-        #errors_text = Align.center(Text.from_markup(msg + "\n", style=color, justify="center"), vertical="middle")
-        #layout["right"].update(Panel(errors_text))
-        
-        ## Console test
-        #with errors_console.pager(styles=True, links=True):
-        #    errors_console.print(msg)
-        ##layout["right"].update(errors_console)
-
-        # Table test
-        max_rows = os.get_terminal_size()[1] - 8
-        errors_table_width = (os.get_terminal_size()[0] / 4) - 8
-        if (max_rows <= 30 or errors_table_width <= 30) and warn_size:
-            infos_table.add_row("[" + warning_color + "]" + "** Your terminal size is likely too small"
-                                + " for live mode, either increase its size or disable live mode **")
-            layout["left"].update(Panel(infos_table))
-            warn_size = 0
-
+        # shown by the live display thread when it runs
+        if ui_events.running:
+            ui_events.message(msg, color)
+        else:
+            show_messages([(msg, color)])
+    else:
+        get_console().print(msg, style=color)
+
+
+def show_messages(messages):
+    # add the (msg, color) messages to the right panel of the live display
+    global nb_rows
+    global warn_size
+    # Text test
+    #errors_text = Align.center(Text.from_markup(msg + "\n", style=color, justify="center"), vertical="middle")
+    #layout["right"].update(Panel(errors_text))
+
+    ## Console test
+    #with errors_console.pager(styles=True, links=True):
+    #    errors_console.print(msg)
+    ##layout["right"].update(errors_console)
+
+    # Table test
+    load_live_ui()
+    (columns, lines) = os.get_terminal_size()
+    max_rows = lines - 8
+    errors_table_width = (columns / 4) - 8
+    if (max_rows <= 30 or errors_table_width <= 30) and warn_size:
+        show_infos(["[" + warning_color + "]" + "** Your terminal size is likely too small"
+                    + " for live mode, either increase its size or disable live mode **"])
+        warn_size = 0
+
+    for (msg, color) in messages:
         #msg = msg + " max_rows: %s, nb_rows: %s" % (max_rows, nb_rows)
         lines_occupied = math.ceil(len(msg) / errors_table_width)
         nb_rows += lines_occupied
@@ -306,11 +788,23 @@ def color_message(msg, color):
             nb_rows = 0
 
         errors_table.add_row("[" + color + "]" + msg)
-        layout["right"].update(Panel(errors_table))
+    layout["right"].update(Panel(errors_table))
 
 
+def info_message(msg, color=None):
+    # a line in the left panel of the live display
+    row = "[" + color + "]" + msg if color else msg
+    if ui_events.running:
+        ui_events.info(row)
     else:
-        console.print(msg, style=color)
+        show_infos([row])
+
+
+def show_infos(rows):
+    load_live_ui()
+    for row in rows:
+        infos_table.add_row(row)
+    layout["left"].update(Panel(infos_table))
 
 
 def dl_status(file_name, dlded_size, real_size):
@@ -323,82 +817,783 @@ def dl_status(file_name, dlded_size, real_size):
     return status
 
 
-def download_cover(page_content, url, task_id):
-    # download album's cover(s)
-    cover_url_re = re.compile('%s' % re_cover_url)
-    cover_url_match = cover_url_re.search(page_content)
+def get_base_url(url):
+    # get website base address to preprend it to images, songs and albums relative urls'
+    base_url = url.split("//", 1)
+    base_url = base_url[0] + "//" + base_url[1].split("/", 1)[0]
+    return base_url
+
+
+## Rate limiter ##
+class TokenBucket:
+    """Allows rate units per second on average, and bursts of burst units."""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.last = time.monotonic()
+        self.lock = threading.Lock()
+
+    def take(self, amount):
+        # the tokens are taken at once, going in debt if needed, then we wait for the debt
+        # to be paid back: a big amount (a whole page) doesn't have to fit in the bucket
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.last) * self.rate)
+            self.last = now
+            self.tokens -= amount
+            wait = -self.tokens / self.rate
+        if wait > 0 and wait_stopping(wait):
+            raise KeyboardInterrupt
+
 
-    cover_url = cover_url_match.group(1)
+class RateMeter:
+    """Measured rate over the last few seconds."""
+
+    def __init__(self, window=5):
+        self.window = window
+        self.events = collections.deque()
+        self.total = 0
+        self.lock = threading.Lock()
+
+    def add(self, amount):
+        with self.lock:
+            self.events.append((time.monotonic(), amount))
+            self.total += amount
+
+    def rate(self):
+        with self.lock:
+            limit = time.monotonic() - self.window
+            while self.events and self.events[0][0] < limit:
+                self.events.popleft()
+            return sum(amount for (_, amount) in self.events) / self.window
+
+
+class RateLimiter:
+    """Requests/s and bytes/s limits per host, shared by all the page fetches and downloads."""
+
+    def __init__(self, max_rps, max_bandwidth):
+        # 0 means no limit, the rates are still measured
+        self.max_rps = max_rps
+        self.max_bandwidth = max_bandwidth
+        self.hosts = {}
+        self.lock = threading.Lock()
+
+    def host(self, netloc):
+        with self.lock:
+            if netloc not in self.hosts:
+                self.hosts[netloc] = (
+                    TokenBucket(self.max_rps, max(1, self.max_rps)) if self.max_rps else None,
+                    TokenBucket(self.max_bandwidth, self.max_bandwidth) if self.max_bandwidth else None,
+                    RateMeter(), RateMeter())
+            return self.hosts[netloc]
+
+    def request(self, netloc):
+        (requests_bucket, _, requests_meter, _) = self.host(netloc)
+        if requests_bucket:
+            requests_bucket.take(1)
+        requests_meter.add(1)
+
+    def transfer(self, netloc, nb_bytes):
+        (_, bytes_bucket, _, bytes_meter) = self.host(netloc)
+        if bytes_bucket and nb_bytes:
+            bytes_bucket.take(nb_bytes)
+        bytes_meter.add(nb_bytes)
+
+    def report(self):
+        with self.lock:
+            hosts = list(self.hosts.items())
+        return ", ".join("%s: %.1f req/s %.2f MB/s" % (netloc, requests_meter.rate(), to_MB(bytes_meter.rate()))
+                         for (netloc, (_, _, requests_meter, bytes_meter)) in hosts)
+
+    def report_totals(self):
+        with self.lock:
+            hosts = list(self.hosts.items())
+        return ", ".join("%s: %d requests %.2f MB" % (netloc, requests_meter.total, to_MB(bytes_meter.total))
+                         for (netloc, (_, _, requests_meter, bytes_meter)) in hosts)
+
+
+rate_limiter = RateLimiter(0, 0)
+
+## End of Rate limiter ##
+
+
+## Concurrency controller ##
+class ConcurrencyController:
+    """Number of simultaneous transfers adapted between min_conn and max_conn (AIMD).
+
+    Every interval, one more transfer is allowed if all of them are busy, and this increase is
+    undone at the next interval if the total throughput didn't grow. Timeouts, server errors,
+    bans and "download limit" pages halve the number of transfers, once per interval at most.
+    """
+
+    def __init__(self, min_conn, max_conn, start, interval=5):
+        self.min_conn = min_conn
+        self.max_conn = max_conn
+        self.limit = max(min_conn, min(start, max_conn))
+        self.interval = interval
+        self.active = 0
+        self.cond = threading.Condition()
+        self.nb_bytes = 0
+        self.last_tick = time.monotonic()
+        self.last_rate = 0
+        self.last_decrease = 0
+        self.increased = False
+
+    def __enter__(self):
+        with self.cond:
+            while self.active >= self.limit:
+                if stopping():
+                    raise KeyboardInterrupt
+                self.cond.wait(0.5)
+            self.active += 1
+
+    def __exit__(self, *exc_info):
+        with self.cond:
+            self.active -= 1
+            self.cond.notify()
 
+    def transferred(self, nb_bytes):
+        if self.min_conn == self.max_conn:
+            return
+        with self.cond:
+            self.nb_bytes += nb_bytes
+            now = time.monotonic()
+            if now - self.last_tick >= self.interval:
+                self.tick(now)
+
+    def tick(self, now):
+        rate = self.nb_bytes / (now - self.last_tick)
+        if self.increased and rate < self.last_rate * 1.05:
+            self.set_limit(self.limit - 1, "no throughput gain (%.2f MB/s)" % to_MB(rate))
+        elif self.active >= self.limit and self.limit < self.max_conn:
+            self.set_limit(self.limit + 1, "%.2f MB/s" % to_MB(rate))
+            self.increased = True
+        self.last_rate = rate
+        self.nb_bytes = 0
+        self.last_tick = now
+
+    def problem(self, reason):
+        if self.min_conn == self.max_conn:
+            return
+        with self.cond:
+            now = time.monotonic()
+            if now - self.last_decrease < self.interval:
+                return
+            self.last_decrease = now
+            self.set_limit(self.limit // 2, reason)
+
+    def set_limit(self, limit, reason):
+        # called with self.cond held
+        limit = max(self.min_conn, min(limit, self.max_conn))
+        self.increased = False
+        if limit == self.limit:
+            return
+        color_message("** %s simultaneous downloads instead of %s (%s) **" % (limit, self.limit, reason),
+            ok_color if limit > self.limit else warning_color)
+        self.limit = limit
+        self.cond.notify_all()
+
+
+concurrency = ConcurrencyController(nb_conn, nb_conn, nb_conn)
+
+## End of Concurrency controller ##
+
+
+## Retry policy ##
+class RetryPolicy:
+    """How long to wait before retrying a failed url, shared by all the downloads.
+
+    The pause doubles (with jitter) at each consecutive failure of the url, up to max_delay.
+    Each url and each host has a retry budget (0: no limit), the host's one counts the retries
+    of the last host_window seconds so that a long run (daemon) isn't stuck once it is spent.
+    A host is paused for every download after breaker_failures consecutive failures (circuit breaker).
+    """
+
+    def __init__(self, base_delay, max_delay, url_budget, host_budget, breaker_failures, breaker_pause,
+                 host_window=host_retries_window):
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.url_budget = url_budget
+        self.host_budget = host_budget
+        self.host_window = host_window
+        self.breaker_failures = breaker_failures
+        self.breaker_pause = breaker_pause
+        self.url_failures = collections.Counter()
+        self.host_failures = collections.Counter() # consecutive ones
+        # times of the retries in the window
+        self.host_retries = collections.defaultdict(collections.deque)
+        self.paused_until = {}
+        self.lock = threading.Lock()
+
+    def failure(self, url, kind="request"):
+        # returns the pause before the next try, or None if the retry budget is spent.
+        # kind separates the budgets of a request and of a whole song download from the same url
+        host = urllib.parse.urlsplit(url).netloc
+        url = (kind, url)
+        with self.lock:
+            self.url_failures[url] += 1
+            self.host_failures[host] += 1
+            now = time.monotonic()
+            retries = self.host_retries[host]
+            retries.append(now)
+            while retries[0] < now - self.host_window:
+                retries.popleft()
+            if self.host_failures[host] >= self.breaker_failures:
+                self.host_failures[host] = 0
+                self.paused_until[host] = time.monotonic() + self.breaker_pause
+                color_message("** Too many failures on %s, pausing it for %s seconds **" 
+                    % (host, self.breaker_pause), warning_color)
+            if ((self.url_budget and self.url_failures[url] > self.url_budget)
+                    or (self.host_budget and len(retries) > self.host_budget)):
+                # if the caller tries this url again later (a song retrying its page), it
+                # starts with a new budget
+                del self.url_failures[url]
+                return None
+            attempt = self.url_failures[url]
+
+        delay = min(self.max_delay, self.base_delay * 2 ** (attempt - 1))
+        return max(delay / 2 + random.uniform(0, delay / 2), self.host_pause(host))
+
+    def success(self, url, kind="request"):
+        host = urllib.parse.urlsplit(url).netloc
+        with self.lock:
+            self.url_failures.pop((kind, url), None)
+            self.host_failures[host] = 0
+
+    def host_pause(self, host):
+        # remaining time of the host's pause, if the circuit breaker is open
+        return max(0, self.paused_until.get(host, 0) - time.monotonic())
+
+
+retry_policy = RetryPolicy(retry_base_delay, retry_max_delay, max_retries, max_host_retries,
+                           breaker_failures, breaker_pause)
+
+
+def interruptible_sleep(seconds):
+    # ctrl-c doesn't have to wait for the end of the pause
+    if wait_stopping(seconds):
+        raise KeyboardInterrupt
+
+
+def retry_after_failure(url, kind="request"):
+    # wait before retrying url, returns False if we must give up
+    delay = retry_policy.failure(url, kind)
+    metrics.count("zic_retries_total", kind=kind, result="retried" if delay is not None else "given up")
+    metrics.event("retry", kind=kind, url=url, pause=delay and round(delay, 3))
+    if delay is None:
+        color_message("** Giving up on %s %s, no retries left **" % (kind, url), error_color)
+        return False
     if debug:
-        color_message("cover: %s" % cover_url, debug_color)
+        color_message("** retrying %s %s in %.1f seconds **" % (kind, url, delay), debug_color)
+    with metrics.phase("retry pause", url=url):
+        interruptible_sleep(delay)
+    return True
 
-    if not cover_url:
-        color_message("** No cover found for this album **", warning_color)
-    else:
-        download_file("", cover_url, task_id)
+## End of Retry policy ##
 
 
-def get_base_url(url):
-    # get website base address to preprend it to images, songs and albums relative urls'
-    base_url = url.split("//", 1)
-    base_url = base_url[0] + "//" + base_url[1].split("/", 1)[0]
-    return base_url
+## Metrics ##
+class Metrics:
+    """Events of every request, retry and phase, as JSON lines and as Prometheus text totals.
+
+    The totals are always kept, the events are only written when a log file is given.
+    """
+
+    def __init__(self, log_path=None):
+        self.lock = threading.Lock()
+        self.log = open(log_path, "a", encoding="utf-8") if log_path else None
+        # {(name, labels): value}, labels being a sorted tuple of (label, value)
+        self.counters = collections.Counter()
+        # longest observation of each summary, not exported
+        self.maxima = {}
+
+    def event(self, event_name, **fields):
+        if not self.log:
+            return
+        import json
+        fields = dict(ts=round(time.time(), 3), event=event_name, **fields)
+        line = json.dumps(fields, ensure_ascii=False) + "\n"
+        with self.lock:
+            self.log.write(line)
+
+    def count(self, name, value=1, **labels):
+        with self.lock:
+            self.counters[(name, tuple(sorted(labels.items())))] += value
+
+    def observe(self, name, seconds, **labels):
+        # Prometheus summary without quantiles
+        with self.lock:
+            key = tuple(sorted(labels.items()))
+            self.counters[(name + "_sum", key)] += seconds
+            self.counters[(name + "_count", key)] += 1
+            self.maxima[(name, key)] = max(seconds, self.maxima.get((name, key), 0))
+
+    @contextlib.contextmanager
+    def phase(self, name, **fields):
+        # time a step of the downloads (page fetch, parse, song page, transfer...)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            self.observe("zic_phase_seconds", seconds, phase=name)
+            self.event("phase", phase=name, seconds=round(seconds, 6), **fields)
+
+    def prometheus(self):
+        with self.lock:
+            counters = sorted(self.counters.items())
+        lines = []
+        families = set()
+        for ((name, labels), value) in counters:
+            family = re.sub(r"_(sum|count)$", "", name)
+            if family not in families:
+                families.add(family)
+                lines.append("# TYPE %s %s" % (family, "counter" if family == name else "summary"))
+            labels = ",".join('%s="%s"' % (label, str(v).replace("\\", "\\\\").replace('"', '\\"'))
+                              for (label, v) in labels)
+            lines.append("%s{%s} %s" % (name, labels, round(value, 6)) if labels else "%s %s" % (name, value))
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path):
+        # replaced at once, for the textfile collectors reading it at any time
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            f.write(self.prometheus())
+        os.replace(path + ".tmp", path)
+
+    def phases(self):
+        # [(phase, count, total seconds, max seconds)]
+        with self.lock:
+            return sorted((dict(labels)["phase"], self.counters[("zic_phase_seconds_count", labels)], value,
+                           self.maxima[("zic_phase_seconds", labels)])
+                          for ((name, labels), value) in self.counters.items() if name == "zic_phase_seconds_sum")
+
+    def phases_report(self):
+        return ", ".join("%s %.1f s" % (phase, seconds) for (phase, _, seconds, _) in self.phases())
+
+    def close(self):
+        with self.lock:
+            if self.log:
+                self.log.close()
+                self.log = None
+
+
+metrics = Metrics()
+
+
+def write_metrics_periodically(path, interval):
+    # daemon thread, the file is written a last time at exit
+    while True:
+        time.sleep(interval)
+        try:
+            metrics.write_prometheus(path)
+        except OSError as e:
+            color_message("** Error: cannot write the metrics to %s: %s **" % (path, str(e)), error_color)
+
+## End of Metrics ##
+
 
+## Profiler ##
+class Profiler:
+    """--profile: cProfile of every thread, or samples of their stacks taken every interval seconds.
 
-def open_url(url, data, range_header):
+    The cProfile stats are written to path (python -m pstats path), the samples as folded stacks,
+    one "function;function;... count" line per stack (flamegraph.pl, speedscope).
+    """
+
+    def __init__(self, path, interval):
+        self.path = path
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.profiles = []
+        self.samples = collections.Counter()
+        self.running = False
+
+    def start(self):
+        self.running = True
+        if self.interval:
+            threading.Thread(target=self.sample, daemon=True).start()
+            return
+        self.start_thread_profile()
+        if sys.version_info < (3, 12):
+            # before 3.12, a profiler only sees its own thread: the threads started
+            # from now on create theirs on their first call
+            threading.setprofile(self.start_thread_profile)
+
+    def start_thread_profile(self, *args):
+        import cProfile
+        profile = cProfile.Profile()
+        with self.lock:
+            self.profiles.append(profile)
+        profile.enable()
+
+    def sample(self):
+        # the frames of the other threads are only read, this costs a few µs per thread and sample
+        me = threading.get_ident()
+        while self.running:
+            time.sleep(self.interval)
+            for (thread_id, frame) in sys._current_frames().items():
+                if thread_id == me:
+                    continue
+                stack = []
+                while frame:
+                    code = frame.f_code
+                    stack.append("%s (%s:%d)" % (code.co_name, os.path.basename(code.co_filename),
+                                                 code.co_firstlineno))
+                    frame = frame.f_back
+                with self.lock:
+                    self.samples[";".join(reversed(stack))] += 1
+
+    def stop(self):
+        # write the profile, returns the lines of its report
+        self.running = False
+        if self.interval:
+            with self.lock:
+                samples = list(self.samples.items())
+            with open(self.path, "w", encoding="utf-8") as f:
+                for (stack, count) in samples:
+                    f.write("%s %d\n" % (stack, count))
+            return self.samples_report(samples)
+
+        import io
+        import pstats
+        threading.setprofile(None)
+        with self.lock:
+            profiles = list(self.profiles)
+        stats = pstats.Stats(profiles[0])
+        for profile in profiles[1:]:
+            stats.add(profile)
+        stats.dump_stats(self.path)
+        report = io.StringIO()
+        stats.stream = report
+        stats.sort_stats("tottime").print_stats(20)
+        return report.getvalue().strip().splitlines()
+
+    def samples_report(self, samples, top=20):
+        # the functions seen the most often on top of the stacks (self) and anywhere in them (total)
+        total = sum(count for (_, count) in samples) or 1
+        own = collections.Counter()
+        inclusive = collections.Counter()
+        for (stack, count) in samples:
+            functions = stack.split(";")
+            own[functions[-1]] += count
+            for function in set(functions):
+                inclusive[function] += count
+        lines = ["%d samples, %s" % (total, self.path), "%7s %7s  function" % ("self %", "total %")]
+        for (function, count) in own.most_common(top):
+            lines.append("%7.1f %7.1f  %s" % (100 * count / total, 100 * inclusive[function] / total, function))
+        return lines
+
+
+profiler = None
+
+
+def phases_table():
+    # time of each step of the downloads, summed over the simultaneous ones
+    from rich import box
+    from rich.table import Table
+    table = Table(title="Steps", box=box.SIMPLE)
+    for (column, justify) in (("step", "left"), ("calls", "right"), ("total s", "right"),
+                              ("mean ms", "right"), ("max ms", "right")):
+        table.add_column(column, justify=justify)
+    for (phase, count, seconds, longest) in metrics.phases():
+        table.add_row(phase, str(count), "%.2f" % seconds, "%.2f" % (seconds * 1000 / count),
+                      "%.2f" % (longest * 1000))
+    return table
+
+## End of Profiler ##
+
+
+## HTTP connection pool ##
+class TimedConnection:
+    """Mixin of the http.client connections recording their DNS and connect (TCP and TLS) times."""
+
+    dns_time = None
+    connect_time = None
+
+    def connect(self):
+        start = time.perf_counter()
+        if not (socks_proxy and socks_port):
+            # resolved here to time it, the socks proxy resolves the names itself
+            self.addresses = [info[4][0] for info in socket.getaddrinfo(self.host, self.port, 0,
+                                                                        socket.SOCK_STREAM)]
+            self.dns_time = time.perf_counter() - start
+            self._create_connection = self.connect_resolved
+        super().connect()
+        self.connect_time = time.perf_counter() - start - (self.dns_time or 0)
+
+    def connect_resolved(self, address, timeout, source_address=None):
+        # socket.create_connection on the addresses resolved by connect()
+        for ip in self.addresses:
+            try:
+                return socket.create_connection((ip, address[1]), timeout, source_address)
+            except OSError as e:
+                error = e
+        raise error
+
+
+class TimedHTTPConnection(TimedConnection, http.client.HTTPConnection):
+    pass
+
+
+class TimedHTTPSConnection(TimedConnection, http.client.HTTPSConnection):
+    pass
+
+
+class ConnectionPool:
+    """Keep idle HTTP(S) connections per host so that they can be reused (keep-alive)."""
+
+    def __init__(self, max_per_host):
+        self.max_per_host = max_per_host
+        self.lock = threading.Lock()
+        self.idle = {}
+        self.opened = 0
+        self.reused = 0
+
+    def get(self, scheme, netloc):
+        # returns a (connection, reused) tuple
+        with self.lock:
+            conns = self.idle.get((scheme, netloc))
+            if conns:
+                self.reused += 1
+                return conns.pop(), True
+            self.opened += 1
+
+        if scheme == "https":
+            conn = TimedHTTPSConnection(netloc, timeout=timeout)
+        else:
+            conn = TimedHTTPConnection(netloc, timeout=timeout)
+        return conn, False
+
+    def put(self, scheme, netloc, conn):
+        with self.lock:
+            conns = self.idle.setdefault((scheme, netloc), [])
+            if len(conns) < self.max_per_host:
+                conns.append(conn)
+                return
+        conn.close()
+
+    def close_all(self):
+        with self.lock:
+            for conns in self.idle.values():
+                for conn in conns:
+                    conn.close()
+            self.idle = {}
+
+
+class PooledResponse:
+    """urllib-like response, closing it gives back its connection to the pool."""
+
+    def __init__(self, pool, scheme, netloc, conn, response, url, timings):
+        self.pool = pool
+        self.scheme = scheme
+        self.netloc = netloc
+        self.conn = conn
+        self.response = response
+        self.url = url
+        # (method, reused, ttfb) of the request, for the metrics
+        self.timings = timings
+        self.headers_received = time.perf_counter()
+        self.nb_bytes = 0
+
+    def info(self):
+        return self.response.msg
+
+    def getcode(self):
+        return self.response.status
+
+    def geturl(self):
+        return self.url
+
+    def read(self, amt=None):
+        data = self.response.read(amt)
+        rate_limiter.transfer(self.netloc, len(data))
+        self.nb_bytes += len(data)
+        return data
+
+    def readinto(self, b):
+        nb_bytes = self.response.readinto(b)
+        rate_limiter.transfer(self.netloc, nb_bytes)
+        self.nb_bytes += nb_bytes
+        return nb_bytes
+
+    def close(self):
+        if self.conn is None:
+            return
+
+        (method, reused, ttfb) = self.timings
+        record_request(self.url, method, self.conn, reused, ttfb, status=self.response.status,
+                       content_type=self.response.getheader("Content-Type", ""), nb_bytes=self.nb_bytes,
+                       transfer=time.perf_counter() - self.headers_received)
+        response = self.response
+        if not response.isclosed() and response.length == 0:
+            # nothing left to read (304, empty body...), this frees the connection
+            response.read()
+
+        if response.isclosed() and not response.will_close:
+            self.pool.put(self.scheme, self.netloc, self.conn)
+        else:
+            # body not fully read or server closing the connection, it can't be reused
+            response.close()
+            self.conn.close()
+        self.conn = None
+
+
+http_pool = ConnectionPool(nb_conn)
+
+
+def record_request(url, method, conn, reused, ttfb, status=None, content_type="", nb_bytes=0, transfer=None,
+                   error=None):
+    # one event per request (and per redirection), the failed ones have an error instead of a status
+    host = urllib.parse.urlsplit(url).netloc
+    kind = content_type.split("/")[0] or "none"
+    metrics.count("zic_requests_total", host=host, status=status or "error", type=kind)
+    metrics.count("zic_response_bytes_total", nb_bytes, host=host, type=kind)
+    if not reused:
+        metrics.count("zic_connections_opened_total", host=host)
+    for (step, seconds) in (("dns", conn.dns_time), ("connect", conn.connect_time), ("ttfb", ttfb),
+                            ("transfer", transfer)):
+        if seconds is not None and not (reused and step in ("dns", "connect")):
+            metrics.observe("zic_request_seconds", seconds, host=host, step=step, type=kind)
+    metrics.event("request", url=url, method=method, status=status, error=error, type=content_type,
+                  bytes=nb_bytes, reused=reused,
+                  dns=None if reused or conn.dns_time is None else round(conn.dns_time, 6),
+                  connect=None if reused or conn.connect_time is None else round(conn.connect_time, 6),
+                  ttfb=ttfb and round(ttfb, 6), transfer=transfer and round(transfer, 6),
+                  proxy="socks5://%s:%s" % (socks_proxy, socks_port) if socks_proxy and socks_port else None)
+
+
+def http_request(url, data, range_header, headers=None):
+    # send the request on a pooled connection and follow redirections,
+    # raises the same HTTPError/URLError exceptions than urllib.request.urlopen
+    method = "GET" if data is None else "POST"
+
+    redirects = 0
+    while True:
+        parts = urllib.parse.urlsplit(url)
+        path = parts.path or "/"
+        if parts.query:
+            path += "?" + parts.query
+
+        myheaders = {"User-Agent": useragent, "Referer": site, "Connection": "keep-alive"}
+        if range_header:
+            myheaders["Range"] = range_header
+        if headers:
+            myheaders.update(headers)
+
+        rate_limiter.request(parts.netloc)
+        conn, reused = http_pool.get(parts.scheme, parts.netloc)
+        start = time.perf_counter()
+        try:
+            conn.request(method, path, body=data, headers=myheaders)
+            response = conn.getresponse()
+        except (http.client.RemoteDisconnected, BrokenPipeError, ConnectionResetError) as e:
+            conn.close()
+            record_request(url, method, conn, reused, None, error=repr(e))
+            if reused:
+                # the server closed this idle connection in our back, use a new one
+                continue
+            raise
+        except socket.gaierror as e:
+            conn.close()
+            record_request(url, method, conn, reused, None, error=repr(e))
+            raise urllib.error.URLError(e)
+        except BaseException as e:
+            conn.close()
+            record_request(url, method, conn, reused, None, error=repr(e))
+            raise
+
+        # time to the response headers, without the DNS and the connection for a new one
+        ttfb = time.perf_counter() - start - (0 if reused else (conn.dns_time or 0) + (conn.connect_time or 0))
+        u = PooledResponse(http_pool, parts.scheme, parts.netloc, conn, response, url, (method, reused, ttfb))
+        location = response.getheader("Location")
+
+        if response.status in (301, 302, 303, 307, 308) and location:
+            response.read()
+            u.close()
+            redirects += 1
+            if redirects > max_redirects:
+                raise urllib.error.HTTPError(url, response.status, "Too many redirections",
+                    response.msg, None)
+            url = urllib.parse.urljoin(url, location)
+            if response.status == 303 or (response.status in (301, 302) and method == "POST"):
+                method = "GET"
+                data = None
+            continue
+
+        if response.status >= 400:
+            response.read()
+            u.close()
+            raise urllib.error.HTTPError(url, response.status, response.reason, response.msg, None)
+
+        return u
+
+## End of HTTP connection pool ##
+
+
+def open_url(url, data, range_header, headers=None):
     if socks_proxy and socks_port:
+        import socks
         socks.set_default_proxy(
             socks.SOCKS5, socks_proxy, socks_port, True
         )  # 4th parameter is to do dns resolution through the socks proxy
         socket.socket = socks.socksocket
 
     while True:
-        if event.is_set():
+        if stopping():
             raise KeyboardInterrupt
 
+        # the circuit breaker may have paused this host
+        interruptible_sleep(retry_policy.host_pause(urllib.parse.urlsplit(url).netloc))
+
         if debug:
             color_message("open_url: %s" % url, debug_color)
 
-        myheaders = {"User-Agent": useragent, "Referer": site}
-        req = urllib.request.Request(url, data, headers=myheaders)
-
-        if range_header:
-            req.add_header("Range", range_header)
-
         try:
-            u = urllib.request.urlopen(req, timeout=timeout)
+            u = http_request(url, data, range_header, headers)
+            retry_policy.success(url)
             if debug > 1:
                 color_message("HTTP reponse code: %s" % u.getcode(), debug_color)
         except urllib.error.HTTPError as e:
+            concurrency.problem("HTTP error %s" % e.code)
             if re.match(r"^HTTP Error 4\d+", str(e)):
+                # not retried, but it counts for the circuit breaker
+                retry_policy.failure(url)
                 color_message("** urllib.error.HTTPError (%s), aborting **" 
                     % str(e), error_color)
                 color_message("** You likely have been banned from the website for a period of time "
-                              + "by downloading too much or too fast **", error_color)
+                              + "by downloading too much or too fast (see --max_rps and --max_bandwidth) **",
+                              error_color)
                 u = None
             else:
                 color_message("** requests.exceptions.HTTPError (%s), reconnecting **" 
                     % str(e), warning_color)
-                continue
+                if retry_after_failure(url):
+                    continue
+                u = None
         except urllib.error.URLError as e:
             if re.search("timed out", str(e.reason)):
+                concurrency.problem("timeout")
                 # on linux "timed out" is a socket.timeout exception,
                 # on Windows it is an URLError exception....
                 if debug:
                     color_message("** Connection timeout (%s), reconnecting **" 
                         % e.reason, warning_color)
-                pause_between_retries()
-                continue
+                if retry_after_failure(url):
+                    continue
+                u = None
             else:
                 color_message("** urllib.error.URLError, aborting (%s) **" % e.reason, error_color)
                 u = None
         except (socket.timeout, socket.error, ConnectionError) as e:
+            concurrency.problem("connection problem")
             if debug:
                 color_message("** Connection problem 2 (%s), reconnecting **" 
                     % str(e), warning_color)
-            pause_between_retries()
-            continue
+            if retry_after_failure(url):
+                continue
+            u = None
         except Exception as e:
             color_message("** Exception: aborting (%s) with error: %s **" 
                 % (url, str(e)), error_color)
@@ -407,67 +1602,201 @@ def open_url(url, data, range_header):
         return u
 
 
-def get_page_soup(url, data):
-    page = open_url(url, data=data, range_header=None)
+## Page cache ##
+class PageCache:
+    """Artist and album pages and the songs' file urls, kept between runs with a TTL and a size limit."""
+
+    def __init__(self, path, ttl, max_size):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.hits = 0
+        self.revalidated = 0
+        self.lock = threading.Lock()
+        import sqlite3
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        with self.lock:
+            # key is the url, prefixed with "POST " for the pages fetched with a POST
+            self.db.execute("CREATE TABLE IF NOT EXISTS pages (key TEXT PRIMARY KEY, content BLOB, "
+                            "charset TEXT, etag TEXT, last_modified TEXT, fetched REAL, used REAL, "
+                            "size INTEGER)")
+            self.db.execute("CREATE TABLE IF NOT EXISTS resolutions (url TEXT PRIMARY KEY, file_url TEXT, "
+                            "fetched REAL)")
+            self.db.commit()
+
+    def is_fresh(self, fetched):
+        # --verify asks the website again
+        return not verify and time.time() - fetched < self.ttl
+
+    def get_page(self, key):
+        # returns (content, charset, etag, last_modified, fresh) or None, a fresh page is a hit
+        with self.lock:
+            row = self.db.execute("SELECT content, charset, etag, last_modified, fetched FROM pages "
+                                  "WHERE key = ?", (key,)).fetchone()
+            if not row:
+                return None
+            self.db.execute("UPDATE pages SET used = ? WHERE key = ?", (time.time(), key))
+            self.db.commit()
+            fresh = self.is_fresh(row[4])
+            if fresh:
+                self.hits += 1
+        return row[:4] + (fresh,)
+
+    def put_page(self, key, content, charset, etag, last_modified):
+        now = time.time()
+        with self.lock:
+            self.db.execute("INSERT OR REPLACE INTO pages VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (key, content, charset, etag, last_modified, now, now, len(content)))
+            self.evict()
+            self.db.commit()
+
+    def touch_page(self, key):
+        # the website answered 304 Not Modified
+        now = time.time()
+        with self.lock:
+            self.db.execute("UPDATE pages SET fetched = ?, used = ? WHERE key = ?", (now, now, key))
+            self.db.commit()
+            self.revalidated += 1
+
+    def evict(self):
+        # remove the least recently used pages until the cache fits in max_size
+        total = self.db.execute("SELECT COALESCE(SUM(size), 0) FROM pages").fetchone()[0]
+        if total <= self.max_size:
+            return
+        for (key, size) in self.db.execute("SELECT key, size FROM pages ORDER BY used").fetchall():
+            self.db.execute("DELETE FROM pages WHERE key = ?", (key,))
+            total -= size
+            if total <= self.max_size:
+                break
+
+    def get_file_url(self, url):
+        with self.lock:
+            row = self.db.execute("SELECT file_url, fetched FROM resolutions WHERE url = ?", 
+                (url,)).fetchone()
+            if row and self.is_fresh(row[1]):
+                self.hits += 1
+                return row[0]
+        return None
+
+    def put_file_url(self, url, file_url):
+        with self.lock:
+            self.db.execute("INSERT OR REPLACE INTO resolutions VALUES (?, ?, ?)", (url, file_url, time.time()))
+            self.db.commit()
+
+    def forget_file_url(self, url):
+        # the file url doesn't work anymore, the song page will be fetched again
+        with self.lock:
+            self.db.execute("DELETE FROM resolutions WHERE url = ?", (url,))
+            self.db.commit()
+
+    def close(self):
+        with self.lock:
+            self.db.execute("DELETE FROM resolutions WHERE fetched < ?", (time.time() - self.ttl,))
+            self.db.commit()
+            self.db.close()
+
+
+page_cache = None
+
+
+def fetch_page(url, data, use_cache=True):
+    # returns (content, charset) of the page, from the cache when it is fresh or not modified
+    key = url if data is None else "POST " + url
+    cache = page_cache if use_cache else None
+    cached = cache.get_page(key) if cache else None
+    headers = {}
+    if cached:
+        (content, charset, etag, last_modified, fresh) = cached
+        if fresh:
+            if debug:
+                color_message("page cache: %s" % url, debug_color)
+            return (content, charset)
+        if etag:
+            headers["If-None-Match"] = etag
+        if last_modified:
+            headers["If-Modified-Since"] = last_modified
+
+    page = open_url(url, data=data, range_header=None, headers=headers)
     if not page:
         return None
 
-    page_soup = BeautifulSoup(page, "html.parser", from_encoding=page.info().get_param("charset"))
+    if page.getcode() == 304 and cached:
+        page.read()
+        page.close()
+        if debug:
+            color_message("page cache: %s not modified" % url, debug_color)
+        cache.touch_page(key)
+        return (content, charset)
+
+    content = page.read()
+    charset = page.info().get_param("charset")
+    if cache:
+        cache.put_page(key, content, charset, page.info().get("ETag"), page.info().get("Last-Modified"))
     page.close()
-    return page_soup
+    return (content, charset)
 
+## End of Page cache ##
 
-def prepare_album_dir(page_url, page_content, base_path, with_album_id):
-    # get album infos from html page content
-    artist = ""
-    title = ""
-    year = ""
 
-    if log:
-        log_to_file("prepare_album_dir", page_content)
+soup_parser = None
 
-    color_message("", ok_color)
 
-    # find artist name
-    artist_info_re = re.compile("%s" % re_artist_info)
-    artist_info = artist_info_re.search(page_content)
+def load_soup_parser():
+    # bs4 is imported with the first page, lxml is optional: it builds the soups faster
+    # than python's html.parser
+    global BeautifulSoup, soup_parser
+    if soup_parser is not None:
+        return
+    from bs4 import BeautifulSoup
+    try:
+        import lxml
+        soup_parser = "lxml"
+    except ImportError:
+        soup_parser = "html.parser"
+
 
-    if not artist_info:
+def get_page_soup(url, data, use_cache=True):
+    with metrics.phase("page fetch", url=url):
+        page = fetch_page(url, data, use_cache)
+    if not page:
+        return None
+
+    (content, charset) = page
+    load_soup_parser()
+    with metrics.phase("soup parse", url=url):
+        return BeautifulSoup(content, soup_parser, from_encoding=charset)
+
+
+def prepare_album_dir(page_url, album_page, base_path, with_album_id):
+    # get album infos from the parsed album page
+    color_message("", ok_color)
+
+    artist = album_page.artist
+    if not artist:
         color_message("Unable to get ARTIST NAME. Using -Unknown-", warning_color)
         #artist = input("Unable to get ARTIST NAME. Please enter here: ")
         artist = "Unknown"
     else:
-        artist = artist_info.group(1)
         color_message("Artist: %s" % artist, ok_color)        
 
-    # find album name
-    title_info_re = re.compile("%s" % re_title_info)
-    title_info = title_info_re.search(page_content)
-
-    if not title_info:
+    title = album_page.title
+    if not title:
         color_message("Unable to get ALBUM NAME. Using -Unknown-", warning_color)
         title = "Unknown"
     else:
-        title = title_info.group(1)
         color_message("Album: %s" % title, ok_color)
 
     # Get the year if it is available
-    year_info_re = re.compile(r'<time datetime="(\d+).*?" itemprop="datePublished"></time>\r?\n?')
-
-    year_info = year_info_re.search(page_content)
-
-    if year_info and year_info.group(1):
-        year = year_info.group(1)
+    year = album_page.year
+    if year:
         color_message("Year: %s" % year, ok_color)
     else:
         color_message("Unable to get ALBUM YEAR.", warning_color)
-        year = ""
 
-    infos_table.add_row(artist + " - " + title + " - " + year)
-    layout["left"].update(Panel(infos_table))
+    if live:
+        info_message(artist + " - " + title + " - " + year)
 
     # prepare album's directory
-    album_id =  re.compile('%s' % re_album_id).search(page_url).group(1)
+    album_id = site_profile.get_album_id(page_url)
     album_id_prefix = (album_id + " - " if with_album_id else "")
     if year:
         album_dir = album_id_prefix + artist + " - " + title + " (" + year + ")"
@@ -478,7 +1807,8 @@ def prepare_album_dir(page_url, page_content, base_path, with_album_id):
     if debug:
         color_message("Album's dir: %s" % (album_dir), debug_color)
 
-    if not os.path.exists(album_dir):
+    # nothing is written to the disk when streaming
+    if not os.path.exists(album_dir) and not stream:
         os.mkdir(album_dir)
 
     return album_dir
@@ -499,7 +1829,211 @@ def get_filename_from_cd(cdisposition):
     return fname[0]
 
 
-def download_file(tracknum, url, task_id: TaskID):
+## Audio validation ##
+class InvalidAudio(Exception):
+    """The bytes of a song are not those of an audio file."""
+
+
+# kbps by (MPEG-1, layer) and bitrate index, layer 3 being Layer I
+mp3_bitrates = {
+    (True, 3): (0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448),
+    (True, 2): (0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384),
+    (True, 1): (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320),
+    (False, 3): (0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256),
+    (False, 2): (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+    (False, 1): (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+}
+# Hz by version (3: MPEG-1, 2: MPEG-2, 0: MPEG-2.5) and sample rate index
+mp3_sample_rates = {3: (44100, 48000, 32000), 2: (22050, 24000, 16000), 0: (11025, 12000, 8000)}
+
+
+def mp3_frame_length(buf, i):
+    # length of the MPEG audio frame whose 4 bytes header is at buf[i], 0 if it isn't one
+    if buf[i] != 0xFF or buf[i + 1] & 0xE0 != 0xE0:
+        return 0
+    version = (buf[i + 1] >> 3) & 3
+    layer = (buf[i + 1] >> 1) & 3
+    bitrate_index = buf[i + 2] >> 4
+    sample_rate_index = (buf[i + 2] >> 2) & 3
+    if version == 1 or layer == 0 or bitrate_index in (0, 15) or sample_rate_index == 3:
+        return 0
+    bitrate = mp3_bitrates[(version == 3, layer)][bitrate_index] * 1000
+    sample_rate = mp3_sample_rates[version][sample_rate_index]
+    padding = (buf[i + 2] >> 1) & 1
+    if layer == 3:
+        return (12 * bitrate // sample_rate + padding) * 4
+    if layer == 1 and version != 3:
+        return 72 * bitrate // sample_rate + padding
+    return 144 * bitrate // sample_rate + padding
+
+
+class AudioValidator:
+    """Checks a song while its bytes arrive: not a web page, then a chain of MP3 frames.
+
+    The frames are walked from header to header, so a corrupted song (lost frames, another
+    file in the middle) is stopped at once instead of after its transfer. At most max_resync
+    bytes of garbage are allowed between two frames, and the tags after the last frame are
+    not checked.
+    """
+
+    def __init__(self, mp3=True):
+        self.mp3 = mp3
+        # bytes from next_frame on, offset being the position of buffer[0] in the song
+        self.buffer = bytearray()
+        self.offset = 0
+        self.next_frame = 0
+        self.frames = 0
+        self.sniffed = False
+        self.done = False
+
+    def feed(self, data):
+        # raises InvalidAudio as soon as the bytes seen so far are wrong
+        if self.done:
+            return
+        self.buffer += data
+        if not self.sniffed:
+            if len(self.buffer) < 16:
+                return
+            self.sniff()
+            if not self.mp3:
+                self.done = True
+                return
+        self.walk()
+
+    def sniff(self):
+        self.sniffed = True
+        head = bytes(self.buffer[:512]).lstrip().lower()
+        if head.startswith((b"<!doctype", b"<html", b"<head", b"<body", b"<?xml", b"{")) or b"<html" in head:
+            # likely the "Exceed the download limit" (Превышение лимита скачивания) page
+            raise InvalidAudio("a web page instead of the song")
+        if self.mp3 and self.buffer.startswith(b"ID3"):
+            # ID3v2 tag, its size is in 4 bytes of 7 bits, and a footer may follow it
+            size = 0
+            for byte in self.buffer[6:10]:
+                size = (size << 7) | (byte & 0x7F)
+            self.next_frame = 10 + size + (10 if self.buffer[5] & 0x10 else 0)
+
+    def walk(self):
+        buf = self.buffer
+        pos = self.next_frame - self.offset
+        while pos + 4 <= len(buf):
+            length = mp3_frame_length(buf, pos)
+            if length:
+                self.frames += 1
+                pos += length
+                continue
+            if pos + 8 > len(buf):
+                break
+            if buf[pos:pos + 3] == b"TAG" or buf[pos:pos + 8] in (b"APETAGEX", b"LYRICSBE"):
+                # the tags at the end of the song
+                self.done = True
+                break
+            found = self.resync(buf, pos)
+            if found is None:
+                if len(buf) - pos < max_resync + 4:
+                    # wait for more bytes
+                    break
+                raise InvalidAudio("no MP3 frame after byte %s" % (self.offset + pos))
+            pos = found
+
+        self.next_frame = self.offset + pos
+        consumed = min(pos, len(buf))
+        del buf[:consumed]
+        self.offset += consumed
+
+    def resync(self, buf, pos):
+        # position of the next frame followed by another one (or by the end of buf), within max_resync bytes
+        end = min(len(buf) - 4, pos + max_resync)
+        i = buf.find(b"\xff", pos + 1, end + 1)
+        while i != -1:
+            length = mp3_frame_length(buf, i)
+            if length and (i + length + 4 > len(buf) or mp3_frame_length(buf, i + length)):
+                return i
+            i = buf.find(b"\xff", i + 1, end + 1)
+        return None
+
+
+def audio_validator(file_name):
+    # the frames are only walked in mp3 files
+    return AudioValidator(mp3=file_name.lower().endswith(".mp3"))
+
+## End of Audio validation ##
+
+
+def feed_file(file_path, digest=None, validator=None):
+    # digest and validator (if given) are fed with the file content
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(max_block_size), b""):
+            if digest:
+                digest.update(block)
+            if validator:
+                validator.feed(block)
+
+
+def file_sha1(file_path):
+    import hashlib
+    digest = hashlib.sha1()
+    feed_file(file_path, digest)
+    return digest
+
+
+def song_digest():
+    # the songs' checksums are only kept in the state database (--state_db, --dedupe),
+    # without it download_file returns None instead of the sha1
+    if not state_db:
+        return None
+    import hashlib
+    return hashlib.sha1()
+
+
+def copy_response(u, f, task_id, max_size=-1, digest=None, validator=None):
+    # Copy the response body into f (at most max_size bytes) and return the number of bytes copied,
+    # digest (if given) is updated with the copied bytes, and validator (if given) checks them
+    # before they are written.
+    # One buffer is reused for all the reads (readinto), the block size is doubled while
+    # blocks come quickly and halved when they are slow, so that fast transfers need few
+    # reads and slow ones still check "event" often. The progress is updated by time.
+    buffer = memoryview(bytearray(max_block_size))
+    block_sz = min_block_size
+    copied = 0
+    not_shown = 0
+    last_update = time.monotonic()
+
+    while max_size < 0 or copied < max_size:
+        size = block_sz if max_size < 0 else min(block_sz, max_size - copied)
+        start = time.monotonic()
+        nb_read = u.readinto(buffer[:size])
+        if not nb_read:
+            break
+        if validator:
+            validator.feed(buffer[:nb_read])
+        f.write(buffer[:nb_read])
+        if digest:
+            digest.update(buffer[:nb_read])
+        copied += nb_read
+        not_shown += nb_read
+        concurrency.transferred(nb_read)
+
+        now = time.monotonic()
+        if now - start < block_read_time / 2 and nb_read == block_sz and block_sz < max_block_size:
+            block_sz *= 2
+        elif now - start > block_read_time * 2 and block_sz > min_block_size:
+            block_sz //= 2
+
+        if now - last_update >= progress_interval:
+            update_progress("update", task_id, advance=not_shown)
+            not_shown = 0
+            last_update = now
+
+        if stopping():
+            update_progress("update", task_id, advance=not_shown)
+            raise KeyboardInterrupt
+
+    update_progress("update", task_id, advance=not_shown)
+    return copied
+
+
+def download_file(tracknum, url, task_id: TaskID, album_dir):
     #process_id = os.getpid()
     process_id = threading.get_native_id()
     file_name = ""
@@ -508,7 +2042,6 @@ def download_file(tracknum, url, task_id: TaskID):
         real_size = -1
         partial_dl = 0
         dlded_size = 0
-        block_sz = 8192
 
         u = open_url(url, data=None, range_header=None)
         if not u:
@@ -521,15 +2054,13 @@ def download_file(tracknum, url, task_id: TaskID):
             file_name = u.info().get_filename()
 
             if not file_name:
+                # a page instead of the song, likely the "download limit" one
+                concurrency.problem("no file name")
                 color_message(" ** download_file: unable to get filename **", error_color)
                 return -1
 
-            if "myzuka" in site:
-                file_name = file_name.replace("_myzuka", "")
-            elif "musify" in site:
-                file_name = url.split("/")[-1]
-                file_name = urllib.request.url2pathname(file_name) # works too
-                  
+            file_name = site_profile.get_file_name(url, file_name)
+
             # add tracknum for the song if it wasn't included in file_name (musify)
             if not re.match(r"^\d+[-_].+", file_name):
                 file_name = tracknum + "_" + file_name
@@ -537,53 +2068,37 @@ def download_file(tracknum, url, task_id: TaskID):
         if debug > 1:
             color_message("** download_file: filename: %s **" % file_name, debug_color)
                 
-        if os.path.exists(file_name):
-            dlded_size = os.path.getsize(file_name)
+        file_path = os.path.join(album_dir, file_name)
+        if os.path.exists(file_path):
+            dlded_size = os.path.getsize(file_path)
 
         if dlded_size <= min_page_size and file_name != covers_name:
             # we may have got an "Exceed the download limit" (Превышение лимита скачивания) 
             # page instead of the song, better restart at beginning.
             dlded_size = 0
 
-        i = 0
-        while i < 5:
-            try:
-                real_size = int(u.info()["content-length"])
-
-                if debug > 1:
-                    color_message("length: %s" % real_size, debug_color)
-                if real_size <= min_page_size and (file_name != covers_name):
-                    # we may have got an "Exceed the download limit" (Превышение лимита скачивания) page, retry
-                    color_message(
-                        "** Served file (%s) too small (<= %s), retrying (verify this file after download) **"
-                        % (file_name, min_page_size), warning_color)
-                    i += 1
-                    continue
-                break
-            except Exception as e:
-                if i == 4:
-                    if debug:
-                        color_message(
-                            "** Unable to get the real size of %s from the server because: %s. **"
-                            % (file_name, str(e)),
-                            warning_color,
-                        )
-                    break  # real_size == -1
-                else:
-                    i += 1
-                    if debug:
-                        color_message(
-                            "** %s problem while getting content-length: %s, retrying **" 
-                                % (process_id, str(e)),
-                            warning_color,
-                        )
-                    continue
+        try:
+            real_size = int(u.info()["content-length"])
+        except (TypeError, ValueError) as e:
+            if debug:
+                color_message("** Unable to get the real size of %s from the server because: %s. **"
+                    % (file_name, str(e)), warning_color)
+        if debug > 1:
+            color_message("length: %s" % real_size, debug_color)
+
+        if 0 <= real_size <= min_page_size and file_name != covers_name:
+            # we may have got an "Exceed the download limit" (Превышение лимита скачивания) page,
+            # the song is retried after a pause (see RetryPolicy)
+            concurrency.problem("served file too small")
+            color_message("** Served file (%s) too small (<= %s), retrying **" 
+                % (file_name, min_page_size), warning_color)
+            u.close()
+            return -1
 
         # find where to start the file download (resume or start at beginning)
         if 0 < dlded_size < real_size:
-            # musify does not correctly support this, there is a mismatch in byte offset that create shorters
-            # and corrupted downloaded files. Even "curl" has the same problem while resuming downloads on musify.
-            if "musify" not in site:
+            # musify does not correctly support this, see site_profile.resume
+            if site_profile.resume:
                 # file incomplete, we need to resume download at correct range
                 u.close()
 
@@ -618,9 +2133,9 @@ def download_file(tracknum, url, task_id: TaskID):
             # file already completed, skipped
             color_message("%s (already complete)" % file_name, ok_color)
             u.close()
-            dl_progress.start_task(task_id)
-            dl_progress.update(task_id, total=int(real_size), advance=dlded_size)
-            return
+            update_progress("start_task", task_id)
+            update_progress("update", task_id, total=int(real_size), advance=dlded_size)
+            return (file_path, dlded_size, file_sha1(file_path).hexdigest() if state_db else None)
         elif dlded_size > real_size:
             # we got a problem, check manually
             color_message(f"** {file_name} is already bigger ({dlded_size}) than the server side "
@@ -632,32 +2147,75 @@ def download_file(tracknum, url, task_id: TaskID):
             return
 
         # show progress
-        dl_progress.start_task(task_id)
-        dl_progress.update(task_id, total=int(real_size), advance=dlded_size)
-
-        # append or truncate
-        if partial_dl:
-            f = open(file_name, "ab+")
-        else:
-            f = open(file_name, "wb+")
-
-        # for the covers whose sizes could be < of our defined block_sz, we reduce it
-        if real_size < block_sz:
-            block_sz = 512
+        update_progress("start_task", task_id)
+        update_progress("update", task_id, total=int(real_size), advance=dlded_size)
+
+        # a song already downloaded in another album is linked instead of downloaded again,
+        # it is recognized from its size and its first bytes
+        prefix = b""
+        prefix_sha1 = None
+        if content_store and not partial_dl and file_name != covers_name and real_size > 0:
+            prefix = read_prefix(u, dedupe_prefix_size)
+            import hashlib
+            prefix_sha1 = hashlib.sha1(prefix).hexdigest()
+            content = content_store.find(real_size, prefix_sha1, file_path)
+            if content:
+                u.close()
+                return content_store.link(content, file_path, task_id)
 
-        # get the file
-        while True:
-            buffer = u.read(block_sz)
-            if not buffer:
-                break
+        # big songs are downloaded in several parts at the same time if the server supports it
+        nb_segments = min(segments, real_size // segment_min_size)
+        if nb_segments > 1 and not partial_dl and site_profile.resume and file_name != covers_name:
+            u.close()
+            ret = download_segments(url, file_path, real_size, nb_segments, task_id)
+            if content_store and prefix_sha1:
+                content_store.add(prefix_sha1, ret)
+            return ret
+
+        # append or truncate, the checksum is computed and the song checked while downloading
+        # (with the part already downloaded when resuming)
+        digest = song_digest()
+        validator = audio_validator(file_name) if file_name != covers_name else None
+        f = None
+        try:
+            if partial_dl:
+                if digest or validator:
+                    feed_file(file_path, digest, validator)
+                unshare_file(file_path)
+                f = open(file_path, "ab+")
             else:
-                dlded_size += len(buffer)
-                f.write(buffer)
-                dl_progress.update(task_id, advance=len(buffer))
-                if event.is_set():
-                    u.close()
-                    f.close()
-                    raise KeyboardInterrupt
+                if validator:
+                    validator.feed(prefix)
+                # a new file: the old one may be linked from other albums (--dedupe)
+                if os.path.exists(file_path):
+                    os.remove(file_path)
+                f = open(file_path, "wb+")
+                # already read to look for the song in the other albums
+                f.write(prefix)
+                if digest:
+                    digest.update(prefix)
+                dlded_size += len(prefix)
+                update_progress("update", task_id, advance=len(prefix))
+
+            # get the file
+            dlded_size += copy_response(u, f, task_id, digest=digest, validator=validator)
+        except KeyboardInterrupt:
+            u.close()
+            if f:
+                f.close()
+            raise
+        except InvalidAudio as e:
+            # stopped as soon as it is wrong, the next try starts again from the beginning
+            u.close()
+            if f:
+                f.close()
+            if os.path.exists(file_path):
+                os.remove(file_path)
+            concurrency.problem("invalid audio")
+            metrics.count("zic_invalid_songs_total")
+            color_message("** %s: %s, retrying **" % (file_name, str(e)), warning_color)
+            update_progress("reset", task_id, start=False)
+            return -1
 
         if real_size == -1:
             real_size = dlded_size
@@ -690,6 +2248,11 @@ def download_file(tracknum, url, task_id: TaskID):
 
         u.close()
         f.close()
+        if dlded_size == real_size:
+            sha1 = digest.hexdigest() if digest else None
+            if content_store and prefix_sha1:
+                content_store.add(prefix_sha1, (file_path, dlded_size, sha1))
+            return (file_path, dlded_size, sha1)
     except KeyboardInterrupt as e:
         if debug:
             color_message("** %s : download_file: keyboard interrupt detected **" 
@@ -706,61 +2269,387 @@ def download_file(tracknum, url, task_id: TaskID):
         return -1
 
 
-def download_song(num_and_url, task_id: TaskID) -> None:
-    process_id = os.getpid()
+def download_file_in_slot(tracknum, url, task_id, album_dir):
+    # wait for one of the simultaneous transfers allowed by the concurrency controller
+    with concurrency:
+        with metrics.phase("file transfer", url=url):
+            return download_file(tracknum, url, task_id, album_dir)
+
+
+def download_segment(url, part_path, start, end, task_id):
+    # download the bytes start to end (included) of url at the same offset in part_path
+    u = open_url(url, data=None, range_header="bytes=%s-%s" % (start, end))
+    if not u:
+        return -1
+
+    try:
+        if u.getcode() != 206:
+            if debug:
+                color_message("** Range/partial download is not supported by server for %s **" % url,
+                    warning_color)
+            return -1
+
+        with open(part_path, "r+b") as f:
+            f.seek(start)
+            return copy_response(u, f, task_id, end - start + 1)
+    finally:
+        u.close()
+
+
+def download_segments(url, file_path, real_size, nb_segments, task_id):
+    # Split the file in nb_segments byte ranges downloaded in parallel in a preallocated
+    # ".part" file, renamed to file_path once complete.
+    part_path = file_path + ".part"
+    file_name = os.path.basename(file_path)
+    with open(part_path, "wb") as f:
+        f.truncate(real_size)
+
+    segment_size = math.ceil(real_size / nb_segments)
+    ranges = [(start, min(start + segment_size, real_size) - 1)
+              for start in range(0, real_size, segment_size)]
+
+    if debug:
+        color_message("** %s: downloading %s segments **" % (file_name, len(ranges)), debug_color)
+
+    with ThreadPoolExecutor(max_workers=len(ranges)) as segments_pool:
+        futures = [segments_pool.submit(download_segment, url, part_path, start, end, task_id)
+                   for (start, end) in ranges]
+        sizes = [future.result() for future in futures]
+
+    dlded_size = sum(size for size in sizes if size != -1)
+    if -1 in sizes or dlded_size != real_size:
+        if debug:
+            color_message(
+                "%s (segmented download incomplete, retrying)" 
+                % dl_status(file_name, dlded_size, real_size), warning_color)
+        # start again from zero
+        update_progress("reset", task_id, start=False)
+        return -1
+
+    # the parts arrive in no particular order, the song is checked once complete
+    digest = song_digest()
+    try:
+        feed_file(part_path, digest, audio_validator(file_name))
+    except InvalidAudio as e:
+        os.remove(part_path)
+        concurrency.problem("invalid audio")
+        metrics.count("zic_invalid_songs_total")
+        color_message("** %s: %s, retrying **" % (file_name, str(e)), warning_color)
+        update_progress("reset", task_id, start=False)
+        return -1
+
+    os.replace(part_path, file_path)
+    if not live:
+        color_message("%s" % dl_status(file_name, dlded_size, real_size), ok_color)
+    return (file_path, dlded_size, digest.hexdigest() if digest else None)
+
+
+## Download state database ##
+class StateDB:
+    """Completed albums and songs, so that the next runs skip them without any request."""
+
+    def __init__(self, path):
+        self.lock = threading.Lock()
+        import sqlite3
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        with self.lock:
+            self.db.execute("CREATE TABLE IF NOT EXISTS albums (album_id TEXT PRIMARY KEY, url TEXT, "
+                            "album_dir TEXT, completed TEXT)")
+            # url is the song (or cover) url found on the album's page
+            self.db.execute("CREATE TABLE IF NOT EXISTS tracks (album_id TEXT, url TEXT, file_path TEXT, "
+                            "size INTEGER, sha1 TEXT, completed TEXT, PRIMARY KEY (album_id, url))")
+            # songs downloaded with --dedupe, by size and sha1 of their first dedupe_prefix_size bytes
+            self.db.execute("CREATE TABLE IF NOT EXISTS contents (size INTEGER, prefix_sha1 TEXT, file_path TEXT, "
+                            "sha1 TEXT, PRIMARY KEY (size, prefix_sha1))")
+            self.db.commit()
+
+    def get_album(self, album_id):
+        # returns the album's directory if it has been completed
+        with self.lock:
+            row = self.db.execute("SELECT album_dir FROM albums WHERE album_id = ?", (album_id,)).fetchone()
+        return row[0] if row else None
+
+    def get_album_tracks(self, album_id):
+        with self.lock:
+            return self.db.execute("SELECT file_path, size FROM tracks WHERE album_id = ?", 
+                (album_id,)).fetchall()
+
+    def get_track(self, album_id, url):
+        # returns (file_path, size, sha1) if the track has been completed
+        with self.lock:
+            return self.db.execute("SELECT file_path, size, sha1 FROM tracks WHERE album_id = ? AND url = ?",
+                (album_id, url)).fetchone()
+
+    def set_album(self, album_id, url, album_dir):
+        with self.lock:
+            self.db.execute("INSERT OR REPLACE INTO albums VALUES (?, ?, ?, ?)", 
+                (album_id, url, os.path.abspath(album_dir), datetime.now().isoformat()))
+            self.db.commit()
+
+    def set_track(self, album_id, url, file_path, size, sha1):
+        with self.lock:
+            self.db.execute("INSERT OR REPLACE INTO tracks VALUES (?, ?, ?, ?, ?, ?)", 
+                (album_id, url, os.path.abspath(file_path), size, sha1, datetime.now().isoformat()))
+            self.db.commit()
+
+    def get_contents(self, size, prefix_sha1):
+        # returns the (file_path, sha1) of the songs with this size and start
+        with self.lock:
+            return self.db.execute("SELECT file_path, sha1 FROM contents WHERE size = ? AND prefix_sha1 = ?",
+                (size, prefix_sha1)).fetchall()
+
+    def set_content(self, size, prefix_sha1, file_path, sha1):
+        with self.lock:
+            self.db.execute("INSERT OR REPLACE INTO contents VALUES (?, ?, ?, ?)", 
+                (size, prefix_sha1, os.path.abspath(file_path), sha1))
+            self.db.commit()
+
+    def close(self):
+        with self.lock:
+            self.db.close()
+
+
+state_db = None
+
+
+def file_has_size(file_path, size):
+    return os.path.exists(file_path) and os.path.getsize(file_path) == size
+
+
+def album_already_done(album_id):
+    # completed album whose files are still there with the same size
+    if not state_db or verify:
+        return None
+    album_dir = state_db.get_album(album_id)
+    if not album_dir:
+        return None
+    for (file_path, size) in state_db.get_album_tracks(album_id):
+        if not file_has_size(file_path, size):
+            return None
+    return album_dir
+
+
+def track_already_done(album, url, task_id):
+    # True if the state database says that this song is complete, unless we --verify
+    if not state_db:
+        return False
+    track = state_db.get_track(album.album_id, url)
+    if not track:
+        return False
+
+    (file_path, size, sha1) = track
+    if not file_has_size(file_path, size):
+        return False
+
+    if verify:
+        if file_sha1(file_path).hexdigest() != sha1:
+            color_message("** %s has changed since its download (checksum), downloading it again **" 
+                % file_path, warning_color)
+            os.remove(file_path)
+        # check it with the server
+        return False
+
+    if debug:
+        color_message("%s (already complete)" % os.path.basename(file_path), ok_color)
+    update_progress("start_task", task_id)
+    update_progress("update", task_id, total=size, completed=size)
+    return True
+
+
+def track_done(album, url, ret):
+    # ret is what download_file returned
+    if state_db and isinstance(ret, tuple):
+        (file_path, size, sha1) = ret
+        state_db.set_track(album.album_id, url, file_path, size, sha1)
+
+
+def download_cover(cover_url, task_id, album):
+    if track_already_done(album, cover_url, task_id):
+        return
+    track_done(album, cover_url, download_file_in_slot("", cover_url, task_id, album.album_dir))
+
+## End of Download state database ##
+
+
+## Deduplication ##
+class ContentStore:
+    """Songs already downloaded, found again from their size and first bytes (--dedupe).
+
+    The same song is often on an album, its compilations and deluxe editions: it is hard linked
+    (or reflinked, or copied, depending on the filesystem) from the album where it was downloaded
+    instead of being transferred again.
+    """
+
+    def __init__(self, db):
+        self.db = db
+        self.lock = threading.Lock()
+        self.linked = 0
+        self.saved_bytes = 0
+
+    def find(self, size, prefix_sha1, file_path):
+        # returns (file_path, size, sha1) of the same song in another album, if it is still there
+        for (path, sha1) in self.db.get_contents(size, prefix_sha1):
+            if os.path.abspath(path) != os.path.abspath(file_path) and file_has_size(path, size):
+                return (path, size, sha1)
+        return None
+
+    def add(self, prefix_sha1, ret):
+        # ret is what download_file returns
+        if isinstance(ret, tuple):
+            (file_path, size, sha1) = ret
+            self.db.set_content(size, prefix_sha1, file_path, sha1)
+
+    def link(self, content, file_path, task_id):
+        (source, size, sha1) = content
+        if os.path.exists(file_path):
+            os.remove(file_path)
+        how = clone_file(source, file_path)
+        with self.lock:
+            self.linked += 1
+            self.saved_bytes += size
+        metrics.count("zic_dedupe_files_total", how=how)
+        metrics.count("zic_dedupe_bytes_total", size)
+        if debug or not live:
+            color_message("%s (%s of %s)" % (os.path.basename(file_path), how, source), ok_color)
+        update_progress("update", task_id, total=size, completed=size)
+        return (file_path, size, sha1)
+
+    def report(self):
+        with self.lock:
+            return "%s songs linked instead of downloaded, %.2f MB saved" % (self.linked, to_MB(self.saved_bytes))
+
+
+content_store = None
+
+
+def read_prefix(u, size):
+    # the first bytes of the response, the transfer goes on from there
+    prefix = b""
+    while len(prefix) < size:
+        data = u.read(size - len(prefix))
+        if not data:
+            break
+        prefix += data
+    return prefix
+
+
+def unshare_file(file_path):
+    # a song linked with other albums gets its own copy before it is written to
+    if os.stat(file_path).st_nlink > 1:
+        shutil.copyfile(file_path, file_path + ".tmp")
+        os.replace(file_path + ".tmp", file_path)
+
+
+def clone_file(source, file_path):
+    # returns how file_path was made: a hard link, else a reflink (btrfs, xfs) or a copy
+    try:
+        os.link(source, file_path)
+        return "hard link"
+    except OSError:
+        pass
+    with open(source, "rb") as src, open(file_path, "wb") as dst:
+        try:
+            import fcntl
+            # FICLONE
+            fcntl.ioctl(dst.fileno(), 0x40049409, src.fileno())
+            return "reflink"
+        except (ImportError, OSError):
+            shutil.copyfileobj(src, dst, max_block_size)
+            return "copy"
+
+## End of Deduplication ##
+
+
+def get_song_file_url(url):
+    # Myzuka doesn't give a diret link to the file at this stage, we must go through another page
+    if not site_profile.song_page:
+        return url
 
+    with metrics.phase("song page", url=url):
+        return resolve_song_page(url)
+
+
+def resolve_song_page(url):
+    if page_cache:
+        file_url = page_cache.get_file_url(url)
+        if file_url:
+            return file_url
+
+    # only its file url is cached (resolutions), forget_file_url must lead to the website
+    page_soup = get_page_soup(url, None, use_cache=False)
+    if not page_soup:
+        return None
+
+    # get the file url
+    file_url = ""
+    for link in page_soup.find_all("a", href=True, class_="no-ajaxy", itemprop="audio", limit=1):
+        file_url = link.get("href")
+        break
+
+    # prepend base url if necessary
+    if re.match(r"^/", file_url):
+        file_url = get_base_url(url) + file_url
+    if page_cache and file_url:
+        page_cache.put_file_url(url, file_url)
+    return file_url
+
+
+def download_song(num_and_url, task_id: TaskID, album) -> None:
     m = re.match(r"^(\d+)-(.+)", num_and_url)
     tracknum = m.group(1)
     url = m.group(2)
-    file_url = ""
 
-    # Myzuka doesn't give a diret link to the file at this stage
-    if "musify" in site:
-        file_url = url
+    if track_already_done(album, url, task_id):
+        return
+    transfer_song(tracknum, url, task_id, album)
+
+
+def transfer_song(tracknum, url, task_id, album, file_url=None):
+    # file_url: None if the song page has not been resolved yet
+    process_id = os.getpid()
 
     while True:  # continue until we have the song or the user interrupts it
         try:
-            if event.is_set():
+            if stopping():
                 raise KeyboardInterrupt
 
             if debug:
                 color_message("%s: downloading song from %s" % (process_id, url), debug_color)
 
-            # Myzuka doesn't give a diret link to the file at this stage, we must go through another page
-            if "myzuka" in site:
-                file_url = ""
-
-                page_soup = get_page_soup(url, None)
-                if not page_soup:
-                    if debug:
-                        color_message("** %s: Unable to get song's page soup, retrying **" 
-                            % process_id, debug_color)
-                    pause_between_retries()
-                    continue
-
-                # get the file url
-                for link in page_soup.find_all("a", href=True, class_="no-ajaxy", itemprop="audio", limit=1):
-                    file_url = link.get("href")
+            if file_url is None:
+                file_url = get_song_file_url(url)
+            if file_url is None:
+                if debug:
+                    color_message("** %s: Unable to get song's page soup, retrying **" 
+                        % process_id, debug_color)
+                if not retry_after_failure(url, "song"):
+                    album.absent_track_flag = 1
                     break
-
-                # prepend base url if necessary
-                if re.match(r"^/", file_url):
-                    file_url = get_base_url(url) + file_url
+                continue
 
             # download song
-            ret = download_file(tracknum, file_url, task_id)
+            ret = download_file_in_slot(tracknum, file_url, task_id, album.album_dir)
             if ret == -1:
+                if page_cache:
+                    # the cached file url may have expired
+                    page_cache.forget_file_url(url)
                 if debug:
                     color_message(
                         "** %s: Problem detected while downloading %s, retrying **" 
                         % (process_id, file_url),
                         warning_color,
                     )
-                pause_between_retries()
+                # the song page is read again
+                file_url = None
+                if not retry_after_failure(url, "song"):
+                    album.absent_track_flag = 1
+                    break
                 continue
             else:
                 if not live:
                     color_message("** downloaded: %s **" % (file_url), ok_color)
+                retry_policy.success(url, "song")
+                track_done(album, url, ret)
                 break
         except KeyboardInterrupt:
             if debug:
@@ -778,218 +2667,1028 @@ def download_song(num_and_url, task_id: TaskID) -> None:
                     warning_color,
                 )
             traceback.print_exc()
-            pause_between_retries()
-            pass
+            file_url = None
+            if not retry_after_failure(url, "song"):
+                album.absent_track_flag = 1
+                break
 
 
-def download_album(url, base_path, with_album_id):
-    reset_errors()
-    reset_progress()
+## Song page resolver ##
+class SongResolver:
+    """Pool turning the song pages (myzuka) into file urls ahead of their transfers.
 
-    page_soup = get_page_soup(url, None)
-    if not page_soup:
-        color_message("** Unable to get album's page soup **", error_color)
-        return
-    page_content = str(page_soup)
+    The song pages are fetched and parsed on a few threads of their own, each song is then handed
+    to the transfer pool with its file url. At most max_ready resolved songs wait for a transfer
+    thread, the next song pages are read when they start.
+    """
 
-    # Beautifulsoup converts "&" to "&amp;" so that it be valid html. 
-    # We need to convert them back with html.unescape.
-    page_content = html.unescape(page_content)
+    def __init__(self, nb_workers, transfer_executor, max_ready):
+        self.executor = ThreadPoolExecutor(max_workers=nb_workers)
+        self.transfer_executor = transfer_executor
+        self.ready = threading.BoundedSemaphore(max_ready)
 
-    album_dir = prepare_album_dir(url, page_content, base_path, with_album_id)
+    def submit(self, num_and_url, task_id, album):
+        # future of the whole song, done when its transfer is
+        future = Future()
+        self.executor.submit(self.resolve, num_and_url, task_id, album, future)
+        return future
 
-    os.chdir(album_dir)
+    def resolve(self, num_and_url, task_id, album, future):
+        m = re.match(r"^(\d+)-(.+)", num_and_url)
+        tracknum = m.group(1)
+        url = m.group(2)
+        try:
+            if track_already_done(album, url, task_id):
+                future.set_result(None)
+                return
+            # wait for room among the resolved songs
+            while not self.ready.acquire(timeout=0.5):
+                if stopping():
+                    raise KeyboardInterrupt
+            try:
+                file_url = get_song_file_url(url)
+            except Exception as e:
+                # the transfer reads the song page again, with the usual retries
+                if debug:
+                    color_message('** Exception caught while resolving %s: "%s" **' % (url, str(e)), 
+                        warning_color)
+                file_url = None
+            try:
+                transfer = self.transfer_executor.submit(self.transfer, tracknum, url, task_id, album, file_url)
+            except BaseException:
+                self.ready.release()
+                raise
+        except BaseException as e:
+            future.set_exception(e)
+            return
+        transfer.add_done_callback(lambda f: self.chain(f, future))
 
-    download_cover(
-        page_content,
-        url,
-        dl_progress.add_task("download", filename=covers_name, start=False),
-    )
+    def transfer(self, tracknum, url, task_id, album, file_url):
+        self.ready.release()
+        transfer_song(tracknum, url, task_id, album, file_url)
 
-    # create list of album's songs
-    songs_links = []
-    absent_track_flag = 0
+    def chain(self, transfer, future):
+        if transfer.cancelled():
+            future.cancel()
+        elif transfer.exception() is not None:
+            future.set_exception(transfer.exception())
+        else:
+            future.set_result(None)
+
+    def shutdown(self, wait=False):
+        self.executor.shutdown(wait=wait)
+
+## End of Song page resolver ##
+
+
+## Run summary ##
+class RunSummary:
+    """What became of each album of the run, albums linked several times are downloaded once."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.albums = collections.OrderedDict()
+        self.duplicates = 0
+        # AlbumJob of the albums queued in the scheduler
+        self.album_jobs = []
+
+    def first_time(self, album_id):
+        with self.lock:
+            if album_id in self.albums:
+                self.duplicates += 1
+                return False
+            self.albums[album_id] = ("queued", album_id)
+            return True
+
+    def set(self, album_id, status, label):
+        # status: finished, incomplete, failed, already complete or interrupted
+        with self.lock:
+            self.albums[album_id] = (status, label)
+
+    def add_album(self, album):
+        with self.lock:
+            self.album_jobs.append(album)
+
+    def counts(self):
+        with self.lock:
+            counts = collections.Counter(status for (status, _) in self.albums.values())
+            counts["duplicates"] = self.duplicates
+        return counts
+
+    def report(self):
+        # returns the (message, color) lines of the summary
+        counts = self.counts()
+        with self.lock:
+            albums = list(self.albums.values())
+        lines = [("** Albums: %s finished, %s incomplete, %s failed, %s already complete, "
+                  "%s interrupted, %s duplicates skipped **"
+                  % (counts["finished"], counts["incomplete"], counts["failed"], counts["already complete"],
+                     counts["interrupted"], counts["duplicates"]),
+                  ok_color if counts["finished"] + counts["already complete"] == len(albums) else warning_color)]
+        for (status, label) in albums:
+            if status in ("incomplete", "failed"):
+                lines.append(("** %s: %s **" % (status.upper(), label), error_color))
+        return lines
+
+
+run_summary = RunSummary()
+
+## End of Run summary ##
+
+
+## Download scheduler ##
+class AlbumJob:
+    """An album whose cover and songs are queued in the scheduler."""
+
+    def __init__(self, url, album_id, album_dir, absent_track_flag):
+        self.url = url
+        # site and id, the album's key in the state database
+        self.album_id = album_id
+        self.album_dir = album_dir
+        self.absent_track_flag = absent_track_flag
+        self.task_ids = []
+        # (file name, completed, total) of the tasks once the album is done and they are removed
+        self.final_progress = {}
+        self.pending = 0
+        self.all_submitted = False
+
+
+def tracks_progress(album):
+    # {task_id: (file name, completed, total)} of the album's cover and songs
+    if album.final_progress:
+        return album.final_progress
+    tasks = {task.id: task for task in dl_progress.tasks}
+    return {task_id: (tasks[task_id].fields["filename"], tasks[task_id].completed, tasks[task_id].total)
+            for task_id in album.task_ids if task_id in tasks}
+
+
+def report_album(album):
+    if stopping():
+        run_summary.set(album.album_id, "interrupted", album.album_dir)
+        if live:
+            info_message("** %s ALBUM INCOMPLETE (user exit) **" % album.album_dir, error_color)
+        else:
+            color_message("** %s ALBUM INCOMPLETE (user exit) **" 
+                % album.album_dir, error_color)
+    elif album.absent_track_flag:
+        run_summary.set(album.album_id, "incomplete", album.album_dir)
+        if live:
+            info_message("** %s ALBUM INCOMPLETE (tracks missing) **" % album.album_dir, error_color)
+        else:
+            color_message("** %s ALBUM INCOMPLETE (tracks missing) **" 
+                % album.album_dir, error_color)
+    else:
+        run_summary.set(album.album_id, "finished", album.album_dir)
+        if state_db and not stream:
+            state_db.set_album(album.album_id, album.url, album.album_dir)
+        if live:
+            info_message("** %s FINISHED **" % album.album_dir, ok_color)
+        else:
+            color_message("** %s FINISHED **" % album.album_dir, ok_color)    
+
+
+class DownloadScheduler:
+    """Shared queue for the covers and songs of all the albums (and artists) to download.
+
+    The nb_conn download slots are shared by every album, so the next album's page is parsed
+    and its songs queued while the last songs of the previous one are still downloading. The
+    song pages (myzuka) go through the resolver first.
+    """
+
+    def __init__(self, nb_conn, look_ahead=2):
+        self.nb_conn = nb_conn
+        # how many songs per download slot we can queue before parsing the next album
+        self.look_ahead = look_ahead
+        self.cond = threading.Condition()
+        self.futures = set()
+        self.queued = 0
+        self.executor = ThreadPoolExecutor(max_workers=nb_conn)
+        # a full round of transfers can wait resolved
+        self.resolver = SongResolver(nb_resolvers, self.executor, nb_conn) if nb_resolvers else None
+
+    def wait_for_room(self):
+        # don't parse the next album while enough songs are already waiting for a slot
+        with self.cond:
+            while self.queued >= self.nb_conn * self.look_ahead:
+                if stopping():
+                    raise KeyboardInterrupt
+                self.cond.wait(0.5)
+
+    def submit_album(self, album, cover_url, songs_links):
+        if cover_url:
+            task_id = dl_progress.add_task("download", filename=covers_name, start=False)
+            album.task_ids.append(task_id)
+            self._add(album, self.executor.submit(download_cover, cover_url, task_id, album))
+
+        # only the song pages need to be resolved
+        resolver = self.resolver if site_profile.song_page else None
+        for num_and_url in songs_links:
+            if stopping():
+                raise KeyboardInterrupt
+            task_id = dl_progress.add_task("download", 
+                filename=urllib.request.url2pathname(num_and_url.split("/")[-1]), 
+                start=False)
+            album.task_ids.append(task_id)
+            if resolver:
+                future = resolver.submit(num_and_url, task_id, album)
+            else:
+                future = self.executor.submit(download_song, num_and_url, task_id, album)
+            self._add(album, future)
+
+        with self.cond:
+            album.all_submitted = True
+            finished = (album.pending == 0)
+        if finished:
+            self._album_done(album)
+
+    def _add(self, album, future):
+        with self.cond:
+            album.pending += 1
+            self.queued += 1
+            self.futures.add(future)
+        future.add_done_callback(lambda f: self._done(album, f))
+
+    def _done(self, album, future):
+        with self.cond:
+            album.pending -= 1
+            finished = (album.pending == 0 and album.all_submitted)
+        if finished:
+            self._album_done(album)
+
+        # only now, so that wait() returns after the album has been reported
+        with self.cond:
+            self.queued -= 1
+            self.futures.discard(future)
+            self.cond.notify_all()
+
+    def _album_done(self, album):
+        report_album(album)
+        # make room in the progress panel for the next albums
+        album.final_progress = tracks_progress(album)
+        for task_id in album.task_ids:
+            update_progress("remove_task", task_id)
+
+    def wait(self):
+        with self.cond:
+            while self.futures:
+                if stopping():
+                    raise KeyboardInterrupt
+                self.cond.wait(0.5)
+
+    def shutdown(self, wait=False):
+        # wait: for the running downloads to stop, the daemon reuses everything afterwards
+        if self.resolver:
+            self.resolver.shutdown(wait=wait)
+        self.executor.shutdown(wait=wait)
+
+## End of Download scheduler ##
+
+
+## Streaming ##
+# With --stream, the songs of each album are written one after the other to stdout, a file or a
+# named pipe (a player, a transcoder) instead of files. The next read_ahead songs are downloaded while
+# the current one is written, each one keeps at most stream_buffer_size bytes in memory: its
+# download waits when the buffer is full. The songs being downloaded are never more than the
+# simultaneous downloads allowed (concurrency.limit), the current one always is one of them.
+
+class StreamSong:
+    """Bytes of a song between its download and the stream, at most max_size of them in memory."""
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.cond = threading.Condition()
+        self.chunks = collections.deque()
+        self.size = 0
+        # bytes given by the downloads, the first "skip" ones of a restarted download are dropped
+        self.written = 0
+        self.skip = 0
+        self.done = False
+        self.closed = False
+
+    def write(self, data):
+        # called by copy_response with its (reused) buffer
+        if self.skip:
+            dropped = min(self.skip, len(data))
+            data = data[dropped:]
+            self.skip -= dropped
+            if not data:
+                return
+        data = bytes(data)
+        with self.cond:
+            while self.size >= self.max_size and not self.closed:
+                if stopping():
+                    raise KeyboardInterrupt
+                self.cond.wait(0.5)
+            if self.closed:
+                raise KeyboardInterrupt
+            self.chunks.append(data)
+            self.size += len(data)
+            self.written += len(data)
+            self.cond.notify_all()
+
+    def finish(self):
+        with self.cond:
+            self.done = True
+            self.cond.notify_all()
+
+    def close(self):
+        # the song won't be read, stop its download
+        with self.cond:
+            self.closed = True
+            self.cond.notify_all()
+
+    def read(self):
+        # next chunk of the song, b"" at its end
+        with self.cond:
+            while not self.chunks and not self.done:
+                if stopping():
+                    raise KeyboardInterrupt
+                self.cond.wait(0.5)
+            if not self.chunks:
+                return b""
+            data = self.chunks.popleft()
+            self.size -= len(data)
+            self.cond.notify_all()
+            return data
+
+
+def open_stream(path):
+    # "-" for stdout, the named pipe is created with --fifo if the path does not exist
+    if path == "-":
+        return sys.stdout.buffer
+    if stream_fifo and not os.path.exists(path):
+        os.mkfifo(path)
+    if not os.path.exists(path) or not stat.S_ISFIFO(os.stat(path).st_mode):
+        return open(path, "wb")
+
+    # the opening of a named pipe waits for a reader, it would not see ctrl-c
+    color_message("** Waiting for a reader on %s **" % path, ok_color)
+    while True:
+        try:
+            fd = os.open(path, os.O_WRONLY | os.O_NONBLOCK)
+            break
+        except OSError as e:
+            if e.errno != errno.ENXIO:
+                raise
+        if stopping():
+            raise KeyboardInterrupt
+        time.sleep(0.1)
+    os.set_blocking(fd, True)
+    return os.fdopen(fd, "wb")
+
+
+def write_stream(data):
+    global stream_output
+    if stream_output is None:
+        stream_output = open_stream(stream)
+    try:
+        stream_output.write(data)
+        stream_output.flush()
+    except BrokenPipeError:
+        color_message("** The stream has been closed by its reader, exiting **", error_color)
+        event.set()
+        raise KeyboardInterrupt
 
-    for link in page_soup.find_all("%s" % re_link_attr, title=re.compile("%s" % re_link_keyword)):
-        # search track number and link
-        link_href = ""
-        link = str(link)
-        deleted_track_re = ""
 
+def stream_file(url, song, task_id):
+    # download the song into "song" from song.written on, returns -1 on failure
+    try:
+        offset = song.written
+        range_header = "bytes=%s-" % offset if offset and site_profile.resume else None
+        u = open_url(url, data=None, range_header=range_header)
+        if not u:
+            return -1
         try:
-            if event.is_set():
+            if not u.info().get_filename():
+                # a page instead of the song, likely the "download limit" one
+                concurrency.problem("no file name")
+                color_message(" ** stream_file: unable to get filename **", error_color)
+                return -1
+
+            try:
+                size = int(u.info()["content-length"])
+            except (TypeError, ValueError):
+                size = -1
+            if 0 <= size <= min_page_size:
+                concurrency.problem("served file too small")
+                color_message("** Served file (%s) too small (<= %s), retrying **" % (url, min_page_size),
+                    warning_color)
+                return -1
+
+            if u.getcode() == 206:
+                total = offset + size if size >= 0 else None
+            else:
+                # sent from the beginning, what has already been streamed is dropped
+                song.skip = offset
+                total = size if size >= 0 else None
+            update_progress("start_task", task_id)
+            update_progress("update", task_id, total=total, completed=offset if not song.skip else 0)
+
+            # a restarted download is checked from its beginning, not a Range one
+            validator = audio_validator(u.info().get_filename()) if u.getcode() != 206 else None
+            try:
+                copied = copy_response(u, song, task_id, validator=validator)
+            except InvalidAudio as e:
+                concurrency.problem("invalid audio")
+                metrics.count("zic_invalid_songs_total")
+                color_message("** %s: %s, retrying **" % (url, str(e)), warning_color)
+                return -1
+            if 0 <= size != copied:
+                if debug:
+                    color_message("** %s: stream incomplete (%s/%s), retrying **" % (url, copied, size),
+                        warning_color)
+                return -1
+            return song.written
+        finally:
+            u.close()
+    except KeyboardInterrupt:
+        raise
+    except Exception as e:
+        if debug:
+            color_message('** Exception caught in stream_file (%s) with error: "%s" **' % (url, str(e)),
+                warning_color)
+        return -1
+
+
+def stream_song(num_and_url, task_id, album, song):
+    url = re.match(r"^(\d+)-(.+)", num_and_url).group(2)
+    file_url = None
+    try:
+        while True:  # continue until we have the song or the user interrupts it
+            if stopping():
                 raise KeyboardInterrupt
-            
-            link_href_re = re.compile("%s" % re_link_href)
-            m = link_href_re.search(link)
-            link_href = m.group('link')
+            try:
+                if file_url is None:
+                    file_url = get_song_file_url(url)
+                if file_url and stream_file(file_url, song, task_id) != -1:
+                    retry_policy.success(url, "song")
+                    return
+            except KeyboardInterrupt:
+                raise
+            except Exception as e:
+                if debug:
+                    color_message('** Exception caught in stream_song (%s) with error: "%s", retrying **'
+                        % (url, str(e)), warning_color)
+            if page_cache:
+                page_cache.forget_file_url(url)
+            file_url = None
+            if not retry_after_failure(url, "song"):
+                album.absent_track_flag = 1
+                return
+    finally:
+        song.finish()
+
+
+def stream_album(album, songs_links):
+    # write the songs in order, the next ones are downloaded meanwhile
+    executor = ThreadPoolExecutor(max_workers=read_ahead + 1)
+    songs = collections.deque()
+    links = iter(songs_links)
+
+    def start_next():
+        num_and_url = next(links, None)
+        if num_and_url is None:
+            return False
+        task_id = dl_progress.add_task("download", 
+            filename=urllib.request.url2pathname(num_and_url.split("/")[-1]), 
+            start=False)
+        album.task_ids.append(task_id)
+        song = StreamSong(stream_buffer_size)
+        executor.submit(stream_song, num_and_url, task_id, album, song)
+        songs.append(song)
+        return True
+
+    def start_songs():
+        # a song whose download is done doesn't use a connection anymore
+        while (len(songs) < read_ahead + 1
+               and sum(1 for song in songs if not song.done) < concurrency.limit
+               and start_next()):
+            pass
 
-            if re.search("myzuka", site):
-                tracknum_infos_re = re.compile(r"%s" % re_tracknum_infos_1 + r"(?P<position>\d+)" + 
-                    re_tracknum_infos_2 + link_href, re.IGNORECASE)
-                # search on whole page since myzuka don't store it in "link"
-                tracknum_infos = tracknum_infos_re.search(page_content)
+    try:
+        start_next()
+        while songs:
+            start_songs()
+            song = songs[0]
+            data = song.read()
+            while data:
+                write_stream(data)
+                start_songs()
+                data = song.read()
+            songs.popleft()
+    finally:
+        for song in songs:
+            song.close()
+        executor.shutdown(wait=False)
+        report_album(album)
+        album.final_progress = tracks_progress(album)
+        for task_id in album.task_ids:
+            update_progress("remove_task", task_id)
+
+## End of Streaming ##
+
+
+def download_album(url, base_path, with_album_id, scheduler):
+    # parse the album's page and queue its cover and songs in the scheduler
+    reset_errors()
 
-            elif re.search("musify", site):
-                tracknum_infos_re = re.compile(r"%s" % re_tracknum_infos_1 + r"(?P<position>\d+)" + 
-                    re_tracknum_infos_2, re.IGNORECASE)
-                tracknum_infos = tracknum_infos_re.search(link)
+    album_id = site_profile.get_album_id(url)
+    if not album_id:
+        run_summary.set(url, "failed", url)
+        color_message("** Error: no album id in %s, skipping it! **" % url, error_color)
+        return
+    album_id = site_profile.name + "/" + album_id
+    if not run_summary.first_time(album_id):
+        if debug:
+            color_message("** %s already queued, skipping it **" % url, debug_color)
+        return
 
-            tracknum = tracknum_infos.group('position')
+    album_dir = album_already_done(album_id) if not stream else None
+    if album_dir:
+        run_summary.set(album_id, "already complete", album_dir)
+        color_message("** %s (already complete) **" % album_dir, ok_color)
+        return
 
-            if debug:
-                color_message("** Got number %s for %s **" % (tracknum, link_href), warning_color)
+    scheduler.wait_for_room()
 
-            # search for missing/deleted tracks from the website.   
-            # For musify, see futher away down the code         
-            if re.search("myzuka", site):
-                deleted_track_re = re.compile("%s" % re_tracknum_infos_1 + tracknum + 
-                    re_tracknum_infos_2 + link_href + '"' + re_deleted_track, re.IGNORECASE)
+    page_soup = get_page_soup(url, None)
+    if not page_soup:
+        run_summary.set(album_id, "failed", url)
+        color_message("** Unable to get album's page soup **", error_color)
+        return
 
-                #print(re_tracknum_infos_1 + tracknum + 
-                #    re_tracknum_infos_2 + link_href + '"' + re_deleted_track)
-                if deleted_track_re.search(page_content):
-                    color_message(
-                        "** The track number %s (%s) is missing from website **" 
-                        % (str(tracknum), link_href), error_color)
-                    absent_track_flag = 1
-                    continue
+    # the soup is read once, no need to serialize and unescape it again
+    with metrics.phase("album parse", url=url):
+        album_page = site_profile.album_parser(page_soup)
 
-            tracknum = str(tracknum).zfill(2)
+    if log:
+        log_to_file("download_album", str(page_soup))
 
-            # prepend base url if necessary
-            if re.match(r"^/", link_href):
-                link_href = get_base_url(url) + link_href
-            # add song number and url in array
-            songs_links.append(str(tracknum) + "-" + link_href)
-            
-        except Exception as e:
-            color_message("** Unable to get number %s for %s **" % (tracknum, link_href), warning_color)
-            #traceback.print_exc()
+    with metrics.phase("album dir", url=url):
+        album_dir = prepare_album_dir(url, album_page, base_path, with_album_id)
 
-    if re.search("musify", site):
-       # There is no "re_link_keyword" in deleted tracks on musify, we can't 
-       # know its tracknumber yet. Good point: the link won't be added to "songs_links".
-       # Bad point: We must do a global search for all deleted links once (cpu intensive)
-       deleted_track_re = re.compile("%s" % re_deleted_track, re.IGNORECASE)
-       for deleted_track in re.findall(deleted_track_re, page_content):
-           color_message(
-               "** The track number %s (%s) is missing from website **" 
-               % (deleted_track[0], deleted_track[1]), error_color)
-           absent_track_flag = 1
+    cover_url = album_page.cover_url
+    if debug:
+        color_message("cover: %s" % cover_url, debug_color)
+    if not cover_url:
+        color_message("** No cover found for this album **", warning_color)
+
+    # create list of album's songs
+    songs_links = []
+    absent_track_flag = 0
+
+    for track in album_page.tracks:
+        if debug:
+            color_message("** Got number %s for %s **" % (track.position, track.href), warning_color)
+
+        link_href = track.href
+        # prepend base url if necessary
+        if re.match(r"^/", link_href):
+            link_href = get_base_url(url) + link_href
+        # add song number and url in array
+        songs_links.append(track.position.zfill(2) + "-" + link_href)
+
+    # search for missing/deleted tracks from the website.   
+    for track in album_page.deleted_tracks:
+        color_message(
+            "** The track number %s (%s) is missing from website **" 
+            % (track.position, track.title or track.href), error_color)
+        absent_track_flag = 1
 
     if debug > 1:
         color_message("** songs_links: %s **" % songs_links, error_color)
 
-    if log:
-        log_to_file("download_album", page_content)
- 
     if not songs_links:
         color_message("** Unable to detect any song links, skipping this album/url **", error_color)
         absent_track_flag = 1
+
+    album = AlbumJob(url, album_id, album_dir, absent_track_flag)
+    run_summary.add_album(album)
+    if stream:
+        stream_album(album, songs_links)
     else:
-        # we launch the threads to do the downloads
+        scheduler.submit_album(album, cover_url, songs_links)
+
+
+class ArtistDiscovery:
+    """Finds the albums of an artist on all the pages of its discography, several pages at a time.
+
+    The artist's page links to the other pages (pagination, categories) which link to more
+    of them, each page is fetched once. The albums urls are given by albums() as soon as
+    they are found, each album once.
+    """
+
+    def __init__(self, url, nb_workers):
+        self.url = url
+        self.artist_id = site_profile.get_artist_id(url)
+        self.pages = {url}
+        self.album_ids = set()
+        self.found = queue.Queue()
+        self.lock = threading.Lock()
+        self.pending = 0
+        self.failed_pages = 0
+        self.executor = ThreadPoolExecutor(max_workers=nb_workers)
+
+    def start(self):
+        self.explore_later(self.url)
+        return self
+
+    def explore_later(self, page_url):
+        with self.lock:
+            self.pending += 1
+        self.executor.submit(self.explore, page_url)
+
+    def explore(self, page_url):
         try:
-            with ThreadPoolExecutor(max_workers=nb_conn) as pool:
-                for num_and_url in songs_links:
-                    task_id = dl_progress.add_task("download", 
-                        filename=urllib.request.url2pathname(num_and_url.split("/")[-1]), 
-                        start=False)
-                    pool.submit(download_song, num_and_url, task_id)
-                    if event.is_set():
-                        raise KeyboardInterrupt
-            pool.shutdown()
-        except KeyboardInterrupt as e:
-            if debug:
-                color_message("** download_album: Program interrupted by user, exiting! **", 
-                    error_color)
-            # pool.terminate()
-            # pool.join()
-            # pool.shutdown()
-            # sys.exit(1)
-            # os._exit(1)
-            exit(1)
+            # the artist pages are fetched with a POST
+            page_soup = get_page_soup(page_url, str.encode(""))
+            if not page_soup:
+                with self.lock:
+                    self.failed_pages += 1
+                color_message("** Unable to get artist's page %s **" % page_url, error_color)
+                return
+            with metrics.phase("artist parse", url=page_url):
+                self.parse(page_url, page_soup)
         except Exception as e:
-            color_message(
-                '** Exception caught in download_album(%s) with error: "%s", retrying **'
-                % (url, str(e)),
-                warning_color,
-            )
+            with self.lock:
+                self.failed_pages += 1
+            color_message("** Exception caught while exploring %s: %s **" % (page_url, str(e)), error_color)
+        finally:
+            with self.lock:
+                self.pending -= 1
+                if self.pending == 0:
+                    self.found.put(None)
+
+    def parse(self, page_url, page_soup):
+        for link in page_soup.find_all("a", href=True):
+            href = link["href"]
+            if site_profile.album_link_re.search(href):
+                # albums are linked several times (cover, title), on several pages
+                m = site_profile.album_id_re.search(href)
+                album_id = m.group(1) if m else href
+                with self.lock:
+                    if album_id in self.album_ids:
+                        continue
+                    self.album_ids.add(album_id)
+                self.found.put(urllib.parse.urljoin(page_url, href))
+            elif self.artist_id and site_profile.is_artist_page(href, self.artist_id):
+                page = urllib.parse.urljoin(page_url, href)
+                with self.lock:
+                    if page in self.pages or len(self.pages) >= max_artist_pages:
+                        continue
+                    self.pages.add(page)
+                self.explore_later(page)
+
+    def albums(self):
+        # the albums urls, until every page has been explored
+        try:
+            while True:
+                if stopping():
+                    raise KeyboardInterrupt
+                try:
+                    album_url = self.found.get(timeout=0.5)
+                except queue.Empty:
+                    continue
+                if album_url is None:
+                    return
+                yield album_url
+        finally:
+            self.executor.shutdown(wait=False)
 
-    os.chdir("..")
 
-    if event.is_set():
-        if live:
-            infos_table.add_row("[" + error_color + "]" + 
-                "** %s ALBUM INCOMPLETE (user exit) **" % album_dir)
-            layout["left"].update(Panel(infos_table))
-        else:
-            color_message("** %s ALBUM INCOMPLETE (user exit) **" 
-                % album_dir, error_color)
-    elif absent_track_flag:
-        if live:
-            infos_table.add_row("[" + error_color + "]" + 
-                "** %s ALBUM INCOMPLETE (tracks missing) **" % album_dir)
-            layout["left"].update(Panel(infos_table))
-        else:
-            color_message("** %s ALBUM INCOMPLETE (tracks missing) **" 
-                % album_dir, error_color)
-    else:
-        if live:
-            infos_table.add_row("[" + ok_color + "]" + "** %s FINISHED **" % album_dir)
-            layout["left"].update(Panel(infos_table))
-        else:
-            color_message("** %s FINISHED **" % album_dir, ok_color)    
+def download_artist(url, base_path, with_album_id, scheduler):
+    color_message("** Warning: we are going to download all albums from this artist! **", 
+        warning_color)
 
+    # the first albums are downloaded while the next pages of the discography are explored
+    discovery = ArtistDiscovery(url, nb_conn).start()
+    for album_url in discovery.albums():
+        try:
+            download_album(album_url, base_path, with_album_id, scheduler)
+        except Exception as e:
+            url_failed(album_url, e)
+        if stopping():
+            raise KeyboardInterrupt
 
-def download_artist(url, base_path, with_album_id):
-    page_soup = get_page_soup(url, str.encode(""))
-    if not page_soup:
-        if debug:
-            color_message("** Unable to get artist's page soup **", error_color)
-        return
+    if debug:
+        color_message("** %s: %s albums found on %s pages **" 
+            % (url, len(discovery.album_ids), len(discovery.pages)), debug_color)
+    if discovery.failed_pages and not discovery.album_ids:
+        color_message("** Unable to get artist's page soup **", error_color)
 
-    color_message("** Warning: we are going to download all albums from this artist! **", 
-        warning_color)
 
-    albums_links = []
-    for link in page_soup.find_all("a", href=True):
-        if re.search(r"%s" % re_album_url, link["href"]):
-            # albums' links may appear multiple times, we need to de-duplicate.
-            if link["href"] not in albums_links:
-                albums_links.append(link["href"])
+def url_failed(url, e):
+    # counted in the summary (as its album if it is one), the next urls are downloaded anyway
+    album_id = site_profile.get_album_id(url) if site_profile.is_album_url(url) else None
+    run_summary.set(site_profile.name + "/" + album_id if album_id else url, "failed", url)
+    color_message("** Error: cannot download %s: %s **" % (url, str(e)), error_color)
+    if debug:
+        traceback.print_exc()
 
-    for album_link in albums_links:
-        download_album(get_base_url(url) + album_link, base_path, with_album_id)
-        if event.is_set():
-            raise KeyboardInterrupt
 
-    infos_table.add_row("[" + ok_color + "]" + "** ARTIST DOWNLOAD FINISHED **")
-    layout["left"].update(Panel(infos_table))
+def read_url_file(path):
+    # one url per line, "-" is stdin, empty lines and lines starting with "#" are ignored
+    f = sys.stdin if path == "-" else open(path, encoding="utf-8")
+    try:
+        return [line.strip() for line in f if line.strip() and not line.strip().startswith("#")]
+    finally:
+        if f is not sys.stdin:
+            f.close()
+
+
+def download_urls(urls, base_path, with_album_id, wait_on_exit=False):
+    # all the albums of all the urls go through the same scheduler, website after website
+    global site
+    global site_profile
+
+    websites = collections.OrderedDict()
+    for url in urls:
+        if not re.match(r"^https?://[^/]+", url):
+            run_summary.set(url, "failed", url)
+            color_message("** Error: %s is not an url, skipping it! **" % url, error_color)
+        elif url not in websites.setdefault(url.split('/')[2], []):
+            websites[url.split('/')[2]].append(url)
+
+    scheduler = DownloadScheduler(concurrency.max_conn)
+    artists_urls = []
+    try:
+        for (domain, website_urls) in websites.items():
+            profile = get_site_profile(domain)
+            if not profile:
+                for url in website_urls:
+                    run_summary.set(url, "failed", url)
+                color_message("** Error: %s is not a supported website, skipping its urls! **" % domain,
+                    error_color)
+                continue
+            # the songs of the previous website use site_profile until they are done
+            scheduler.wait()
+            site = domain
+            site_profile = profile
+
+            for url in website_urls:
+                try:
+                    if site_profile.is_artist_url(url):
+                        download_artist(url, base_path, with_album_id, scheduler)
+                        artists_urls.append(url)
+                    elif site_profile.is_album_url(url):
+                        download_album(url, base_path, with_album_id, scheduler)
+                    else:
+                        run_summary.set(url, "failed", url)
+                        color_message(
+                            "** Error: unable to recognize url, it should contain '%s' or '%s'! **" 
+                            % (site_profile.artist_url, site_profile.album_url), error_color)
+                except Exception as e:
+                    url_failed(url, e)
+        scheduler.wait()
+    finally:
+        scheduler.shutdown(wait_on_exit)
+
+    for url in artists_urls:
+        if live:
+            info_message("** ARTIST DOWNLOAD FINISHED **", ok_color)
+        else:
+            color_message("** ARTIST DOWNLOAD FINISHED (%s) **" % url, ok_color)
+
+
+## Daemon mode ##
+class DaemonJob:
+    """Urls submitted to the daemon, downloaded like the urls of a command line run."""
+
+    def __init__(self, job_id, urls):
+        self.id = job_id
+        self.urls = urls
+        self.status = "queued" # then running, done, cancelled or failed
+        self.created = datetime.now().isoformat()
+        self.summary = RunSummary()
+        # checked by the downloads while the job runs (stopping())
+        self.cancel_event = threading.Event()
+
+    def to_dict(self, with_tracks=False):
+        job = {"id": self.id, "status": self.status, "created": self.created, "urls": self.urls,
+               "albums": dict(self.summary.counts())}
+        if with_tracks:
+            with self.summary.lock:
+                albums = list(self.summary.album_jobs)
+                statuses = dict(self.summary.albums)
+            job["albums_details"] = [{
+                "url": album.url,
+                "dir": album.album_dir,
+                "status": statuses.get(album.album_id, ("queued", ""))[0],
+                "tracks": [{"file": name, "completed": completed, "total": total}
+                           for (name, completed, total) in tracks_progress(album).values()],
+            } for album in albums]
+        return job
+
+
+class Daemon:
+    """Queue of the jobs, downloaded one after the other by the same warm process."""
+
+    def __init__(self, base_path, with_album_id):
+        self.base_path = base_path
+        self.with_album_id = with_album_id
+        self.jobs = collections.OrderedDict()
+        self.queue = collections.deque()
+        self.cond = threading.Condition()
+        self.next_id = 1
+        self.current = None
+
+    def submit(self, urls):
+        with self.cond:
+            job = DaemonJob(self.next_id, urls)
+            self.next_id += 1
+            self.jobs[job.id] = job
+            self.queue.append(job)
+            self.cond.notify()
+        return job
+
+    def cancel(self, job_id):
+        # a queued job is dropped, the running one is stopped like with ctrl-c
+        with self.cond:
+            job = self.jobs.get(job_id)
+            if not job or job.status not in ("queued", "running"):
+                return False
+            if job.status == "queued":
+                self.queue.remove(job)
+                job.status = "cancelled"
+            else:
+                job.cancel_event.set()
+        return True
+
+    def next_job(self):
+        with self.cond:
+            while not self.queue:
+                if event.is_set():
+                    raise KeyboardInterrupt
+                self.cond.wait(0.5)
+            self.current = self.queue.popleft()
+            self.current.status = "running"
+            return self.current
+
+    def run(self):
+        global run_summary
+        global cancel_event
+        while True:
+            job = self.next_job()
+            color_message("** daemon: starting job %s **" % job.id, ok_color)
+            run_summary = job.summary
+            cancel_event = job.cancel_event
+            try:
+                download_urls(job.urls, self.base_path, self.with_album_id, wait_on_exit=True)
+                status = "done"
+            except KeyboardInterrupt:
+                # ctrl-c stops the daemon, a cancellation only this job
+                if event.is_set():
+                    with self.cond:
+                        job.status = "cancelled"
+                        self.current = None
+                    raise
+                status = "cancelled"
+            except Exception as e:
+                color_message("** daemon: job %s failed: %s **" % (job.id, str(e)), error_color)
+                traceback.print_exc()
+                status = "failed"
+            with self.cond:
+                job.status = status
+                self.current = None
+            for (msg, color) in job.summary.report():
+                color_message("** daemon: job %s: %s" % (job.id, msg.lstrip("* ")), color)
+
+    def metrics(self):
+        with self.cond:
+            statuses = collections.Counter(job.status for job in self.jobs.values())
+        return {
+            "jobs": dict(statuses),
+            "http_connections": {"opened": http_pool.opened, "reused": http_pool.reused},
+            "hosts": {netloc: {"requests": requests_meter.total, "bytes": bytes_meter.total,
+                               "requests_per_s": requests_meter.rate(), "bytes_per_s": bytes_meter.rate()}
+                      for (netloc, (_, _, requests_meter, bytes_meter)) in list(rate_limiter.hosts.items())},
+            "simultaneous_downloads": {"limit": concurrency.limit, "active": concurrency.active},
+            "page_cache": {"hits": page_cache.hits, "revalidated": page_cache.revalidated} if page_cache else None,
+            "dedupe": {"linked": content_store.linked, "saved_bytes": content_store.saved_bytes}
+                      if content_store else None,
+        }
+
+
+class DaemonHandler:
+    """Local HTTP/JSON API of the daemon:
+    POST /jobs {"urls": [...]}, GET /jobs, GET /jobs/ID (with the tracks progress),
+    DELETE /jobs/ID (cancel), GET /metrics, GET /metrics/prometheus
+
+    Mixed with http.server's BaseHTTPRequestHandler by run_daemon, http.server is only imported
+    in daemon mode.
+    """
+
+    def log_message(self, format, *args):
+        if debug:
+            color_message("daemon: " + format % args, debug_color)
+
+    def send_json(self, code, data):
+        import json
+        body = json.dumps(data, indent=1).encode()
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def job_id(self):
+        m = re.match(r"^/jobs/(\d+)$", self.path)
+        return int(m.group(1)) if m else None
+
+    def do_GET(self):
+        daemon = self.server.daemon
+        if self.path == "/jobs":
+            with daemon.cond:
+                jobs = list(daemon.jobs.values())
+            return self.send_json(200, [job.to_dict() for job in jobs])
+        if self.path == "/metrics":
+            return self.send_json(200, daemon.metrics())
+        if self.path == "/metrics/prometheus":
+            body = metrics.prometheus().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            return self.wfile.write(body)
+        job = daemon.jobs.get(self.job_id())
+        if job:
+            return self.send_json(200, job.to_dict(with_tracks=True))
+        self.send_json(404, {"error": "not found"})
+
+    def do_POST(self):
+        if self.path != "/jobs":
+            return self.send_json(404, {"error": "not found"})
+        import json
+        try:
+            request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            urls = request["urls"]
+            if isinstance(urls, str):
+                urls = [urls]
+            # a non-empty list of non-empty strings, anything else would fail in the job
+            if not isinstance(urls, list) or not urls or not all(isinstance(url, str) and url.strip()
+                                                                 for url in urls):
+                raise ValueError("bad urls")
+            urls = [url.strip() for url in urls]
+        except (ValueError, KeyError, TypeError):
+            return self.send_json(400, {"error": 'expected {"urls": ["url", ...]}'})
+        job = self.server.daemon.submit(urls)
+        self.send_json(201, job.to_dict())
+
+    def do_DELETE(self):
+        job_id = self.job_id()
+        if job_id not in self.server.daemon.jobs:
+            return self.send_json(404, {"error": "not found"})
+        if not self.server.daemon.cancel(job_id):
+            return self.send_json(409, {"error": "job already finished"})
+        self.send_json(200, self.server.daemon.jobs[job_id].to_dict())
+
+
+def run_daemon(port, urls, base_path, with_album_id):
+    import http.server
+    daemon = Daemon(base_path, with_album_id)
+    handler = type("DaemonHandler", (DaemonHandler, http.server.BaseHTTPRequestHandler), {})
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", port), handler)
+    server.daemon_threads = True
+    server.daemon = daemon
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    color_message("** daemon: listening on http://127.0.0.1:%s **" % port, ok_color)
+
+    if urls:
+        daemon.submit(urls)
+    try:
+        daemon.run()
+    finally:
+        server.shutdown()
+
+## End of Daemon mode ##
 
 
 def main():
     global site
     global live
     global nb_conn
+    global segments
+    global nb_resolvers
+    global verify
+    global state_db
+    global content_store
+    global page_cache
+    global rate_limiter
+    global concurrency
+    global retry_policy
     global debug
     global socks_proxy
     global socks_port
     global timeout
     global script_name
+    global http_pool
+    global metrics
+    global profiler
+    global stream
+    global stream_fifo
+    global read_ahead
 
-    global re_artist_url
-    global re_album_url
-    global re_album_id
-    global re_cover_url
-    global re_tracknum_infos_1
-    global re_tracknum_infos_2
-    global re_deleted_track
-    global re_artist_info
-    global re_title_info
-    global re_link_attr
-    global re_link_keyword
-    global re_link_href
+    global site_profile
 
     script_name = os.path.basename(sys.argv[0])
 
@@ -1009,111 +3708,135 @@ def main():
                         help="Timeout for HTTP connections in seconds")
     parser.add_argument("-n", "--nb_conn", type=int, default=3, 
                         help="Number of simultaneous downloads (max 3 for tempfile.ru)")
+    parser.add_argument("--min_conn", type=int, default=0,
+                        help="With --max_conn, the number of simultaneous downloads is adapted between "
+                            + "min_conn and max_conn: raised while the throughput grows, halved on errors. "
+                            + "Defaults to nb_conn.")
+    parser.add_argument("--max_conn", type=int, default=0,
+                        help="Maximum number of simultaneous downloads, see --min_conn. Defaults to nb_conn.")
+    parser.add_argument("--segments", type=int, default=1,
+                        help="Download each song in up to this number of parts at the same time, each part "
+                            + "of at least %s MB: a song of less than %s MB is not split. "
+                            % (segment_min_size // 1024 // 1024, 2 * segment_min_size // 1024 // 1024)
+                            + "Not used on musify which does not support partial downloads")
+    parser.add_argument("--resolvers", type=int, default=nb_resolvers,
+                        help="Song pages (myzuka) resolved into file urls at the same time, ahead of the "
+                            + "downloads. 0 to resolve them in the download slots")
     parser.add_argument("-p", "--path", type=str, default=".", 
                         help="Base directory in which album(s) will be downloaded. Defaults to current.")
     parser.add_argument("--with_album_id", action='store_true',
                         help="Include the myzuka album ID in the directory name, " +
                             "to seperate albums with multiples cd in different dirs")
+    parser.add_argument("--max_retries", type=int, default=max_retries,
+                        help="Retries of each page or song before giving up, the pause between them doubles "
+                            + "from %s to %s seconds. 0 for no limit." % (retry_base_delay, retry_max_delay))
+    parser.add_argument("--max_host_retries", type=int, default=max_host_retries,
+                        help="Retries on each website in the last hour before giving up. 0 for no limit.")
+    parser.add_argument("--max_rps", type=float, default=0,
+                        help="Maximum number of requests per second to each host, for all the downloads "
+                            + "together. Defaults to 0: no limit.")
+    parser.add_argument("--max_bandwidth", type=int, default=0,
+                        help="Maximum bandwidth used on each host in KB/s, for all the downloads together. "
+                            + "Defaults to 0: no limit.")
+    parser.add_argument("--state_db", action='store_true',
+                        help="Record the completed albums and songs in a database, the next runs skip them "
+                            + "without connecting to the website")
+    parser.add_argument("--state_db_path", type=str, default=None, metavar="PATH",
+                        help="File of the state database, implies --state_db. "
+                            + "Defaults to .generic-zic-downloader.db in the download path.")
+    parser.add_argument("--dedupe", action='store_true',
+                        help="Songs already downloaded with --dedupe in another album (same size and first %s KB) "
+                            % (dedupe_prefix_size // 1024)
+                            + "are hard linked from there, or reflinked or copied, instead of downloaded again")
+    parser.add_argument("--verify", action='store_true',
+                        help="Check again with the website the albums and songs completed in the state "
+                            + "database, and the checksums of their files")
+    parser.add_argument("--cache", action='store_true',
+                        help="Cache the artist and album pages and the songs' file urls between runs")
+    parser.add_argument("--cache_path", type=str, default=None, metavar="PATH",
+                        help="File of the page cache, implies --cache. "
+                            + "Defaults to .generic-zic-downloader.cache in the download path.")
+    parser.add_argument("--cache_ttl", type=int, default=cache_ttl,
+                        help="Seconds during which the cached pages are used without asking the website, "
+                            + "after that they are revalidated (ETag/Last-Modified)")
+    parser.add_argument("--cache_size", type=int, default=cache_size,
+                        help="Maximum size of the cached pages in MB, the least recently used ones are "
+                            + "removed first. 0 disables the cache.")
     parser.add_argument("-v", "--version", action="version", version="%(prog)s, version: " + str(version))
 
-    parser.add_argument("url", action="store", help="URL of album or artist page")
+    parser.add_argument("--daemon", type=int, default=0, metavar="PORT",
+                        help="Keep running and download the jobs submitted to a local HTTP/JSON API on this "
+                            + "port (POST /jobs, GET /jobs, GET /jobs/ID, DELETE /jobs/ID, GET /metrics)")
+    parser.add_argument("--url_file", type=str, default=None,
+                        help='File with one album or artist url per line ("-" for stdin), downloaded with the '
+                            + "urls given as arguments")
+    parser.add_argument("--metrics_log", type=str, default=None,
+                        help="Append an event per request (DNS, connect, time to first byte and transfer times, "
+                            + "bytes, status, proxy), retry and step (pages, parsing, transfers) to this "
+                            + "JSON lines file")
+    parser.add_argument("--metrics_file", type=str, default=None,
+                        help="Write the totals of the requests, retries and steps to this file in the "
+                            + "Prometheus text format, every %s seconds and at exit" % metrics_interval)
+    parser.add_argument("--profile", type=str, default=None, metavar="FILE",
+                        help="Profile the run: write the cProfile stats of all the threads to FILE (python -m "
+                            + "pstats FILE), and print the hottest functions and the time of each step at exit")
+    parser.add_argument("--profile_interval", type=int, default=0, metavar="MS",
+                        help="With --profile, sample the stacks of all the threads every MS milliseconds instead "
+                            + "of cProfile, with a low overhead, and write them as folded stacks (flamegraph.pl)")
+    parser.add_argument("--stream", type=str, default=None, metavar="PATH",
+                        help='Write the songs of the albums in order to PATH instead of files: "-" for stdout '
+                            + "(without the live display), a file, or a named pipe for a player")
+    parser.add_argument("--fifo", action='store_true',
+                        help="With --stream, create PATH as a named pipe if it does not exist")
+    parser.add_argument("--read_ahead", type=int, default=read_ahead,
+                        help="With --stream, number of songs downloaded while the current one is written, "
+                            + "each one keeps at most %s MB in memory. " % (stream_buffer_size // 1024 // 1024)
+                            + "They count in the simultaneous downloads (--nb_conn).")
+    parser.add_argument("url", action="store", nargs="*", 
+                        help="URL(s) of album or artist page")
 
     args = parser.parse_args()
 
+    stream = args.stream
+    stream_fifo = args.fifo
+    read_ahead = max(0, args.read_ahead)
+    if stream and args.daemon:
+        parser.error("--stream can't be used with --daemon")
+    live = int(args.live)
+    if stream == "-":
+        # stdout is the stream
+        live = 0
     debug = int(args.debug)
     if debug:
         color_message("Debug level: %s" % debug, debug_color)
 
     nb_conn = int(args.nb_conn)
+    min_conn = min(args.min_conn or nb_conn, nb_conn)
+    max_conn = max(args.max_conn or nb_conn, nb_conn)
+    concurrency = ConcurrencyController(min_conn, max_conn, nb_conn)
+    if debug and min_conn != max_conn:
+        color_message("Simultaneous downloads: between %s and %s" % (min_conn, max_conn), debug_color)
+    http_pool = ConnectionPool(max_conn)
+    rate_limiter = RateLimiter(args.max_rps, args.max_bandwidth * 1024)
+    retry_policy = RetryPolicy(retry_base_delay, retry_max_delay, args.max_retries, args.max_host_retries,
+                               breaker_failures, breaker_pause)
+    segments = int(args.segments)
+    nb_resolvers = int(args.resolvers)
+    verify = int(args.verify)
     timeout = int(args.timeout)
-    live = int(args.live)
     with_album_id = bool(args.with_album_id)
-    site = args.url
-    site = site.split('/')[2] # get the domain only
-
-    if "myzuka" in site:
-        re_artist_url = r"/Artist/.*"
-        re_album_url = r"/Album/.*"
-        re_album_id = r"Album/(\d+)"
-        re_cover_url = r'<img alt=".+?" itemprop="image" src="(.+?)"/>'
-        re_tracknum_infos_1 = (r'<div class="position">\r?\n?'
-                            r'(?:\r?\n?)*'
-                            r'(?:\s)*')
-                            #(?P<position>\d+)
-        re_tracknum_infos_2 = (r'\r?\n?'
-                            r'(?:\r?\n?)*'
-                            r'(?:\s)*</div>\r?\n?'
-                            r'(?:\s)*<div class="options">\r?\n?'
-                            r'(?:\s)*<div class="top">\r?\n?'
-                            r'(?:\s)*<span (?:.+?)title="Сохранить в плейлист"></span>\r?\n?'
-                            r'(?:\s)*<span (?:.+?)title="Добавить в плеер"(?:.*?)>(?:.*?)</span>\r?\n?'
-                            r'(?:\s)*<a href="')
-        re_link_href = r'(?P<link>/Song/.+?)"'
-        #re_deleted_track = '<span>(?P<title>.+?)</span>(?:\s)*<span class=(?:.+?)>\[Удален по требованию правообладателя\]</span>'
-        re_deleted_track = (r'(?:.+?)</a>\r?\n?'
-                            r'(?:\s)*<a class=(?:.+?)</a>\r?\n?'
-                            r'(?:\s)*</div>\r?\n?'
-                            r'(?:\s)*<div class=(?:.+?)</div>\r?\n?'
-                            r'(?:\s)*</div>\r?\n?'
-                            r'(?:\s)*<div class="details">\r?\n?'
-                            r'(?:\s)*<div class="time">(?:.+?)</div>\r?\n?'
-                            r'(?:\s)*<a class=(?:.+?)<span(?:.+?)>\r?\n?'
-                            r'(?:\s)*<meta (?:.+?)/>\r?\n?'
-                            r'(?:\s)*<meta (?:.+?)/>\r?\n?'
-                            r'(?:\s)*</span>\r?\n?'
-                            r'(?:\s)*<p>\r?\n?'
-                            r'<span>(?P<title>.+?)</span>'
-                            r'(?:\s)*<span class=(?:.+?)>\[Удален по требованию правообладателя\]</span>')
-        re_artist_info = (r'<td>Исполнитель:</td>\r?\n?'
-                        r'(?:\s)*<td>\r?\n?'
-                        r'(?:\r?\n?)*'
-                        r'(?:\s)*<a (?:.+?)>\r?\n?'
-                        r'(?:\s)*<meta (?:.+?)itemprop="url"(?:.*?)(?:\s)*/>\r?\n?'
-                        r'(?:\s)*<meta (?:.+?)itemprop="name"(?:.*?)(?:\s)*/>\r?\n?'
-                        r'(?:\r?\n?)*'
-                        r'(?:\s)*(.+?)\r?\n?'
-                        r'(?:\r?\n?)*'
-                        r'(?:\s)*</a>')
-        re_title_info = (r'<span itemprop="title">(?:.+?)</span>\r?\n?'
-                        r'(?:\r?\n?)*'
-                        r'(?:\s)*</a>/\r?\n?'
-                        r'(?:\r?\n?)*'
-                        r'(?:\s)*<span (?:.*?)itemtype="http://data-vocabulary.org/Breadcrumb"(?:.*?)>(.+?)</span>')
-        re_link_attr = "a"
-        re_link_keyword = r"^Скачать.*"
-
-    elif "musify" in site:
-        re_artist_url = r"/artist/.*"
-        re_album_url = r"/release/.*"
-        re_album_id = r"release/.+-(\d+)"
-        re_cover_url = r'<link href="(.+?)" rel="image_src"(?:\s)*/?>'
-        re_tracknum_infos_1 = r'<div (?:.*?)data-position="'
-                                #(?P<position>\d+)'
-        re_tracknum_infos_2 = '"'
-        re_link_href = r'<div(?:.*?)data-url="(?P<link>.+?\.mp3)"'
-        re_deleted_track = (r'<div class="playlist__position">(?:\r?\n?)?'
-                            r'(?:\s)*(?P<position>\d+)(?:\r?\n?)?'
-                            r'(?:\s)*</div>(?:\r?\n?)?'
-                            r'(?:\s)*<div class="playlist__details">(?:\r?\n?)?'
-                            r'(?:\s)*<div class="playlist__heading">(?:\r?\n?)?'
-                            r'(?:\s)*<a(?:.+?)>Ленинград</a>(?:.+?)<a(?:.+?)>(?P<title>.+?)</a>'
-                            r'(?:\s)*<span(?:.+?)>Недоступен</span>')
-        re_artist_info = (r'(?:\s)*<i (?:.*?)title="Исполнитель"(?:.*?)'
-                          r'(?:\s)*></i>\r?\n?(?:\r?\n?)*'
-                          r'(?:\s)*<a (?:.+?)>\r?\n?(?:\r?\n?)*'
-                          r'(?:\s)*<meta (?:.+?)itemprop="url"(?:.*?)'
-                          r'(?:\s)*/?>\r?\n?(?:\r?\n?)*'
-                          r'(?:\s)*<meta (?:.+?)itemprop="name"(?:.*?)'
-                          r'(?:\s)*/?>\r?\n?(?:\r?\n?)*'
-                          r'(?:\s)*(.+?)\r?\n?(?:\r?\n?)*'
-                          r'(?:\s)*(</meta>)*\r?\n?(?:\s)*</a>')
-        re_title_info = (r'<meta(?:.*?)itemprop="position"(?:.*?)'
-                        r'(?:\s)*/?>\r?\n?(?:\r?\n?)*'
-                        r'(?:\s)*</a>\r?\n?(?:\r?\n?)*'
-                        r'(?:\s)*</li>\r?\n?(?:\r?\n?)*'
-                        r'(?:\s)*<li (?:.*?)class="breadcrumb-item active"(?:.*?)>(.+?)</li>')
-        re_link_attr = "div"
-        re_link_keyword = r"^Слушать.*"
+    urls = args.url
+    if args.url_file:
+        try:
+            urls = urls + read_url_file(args.url_file)
+        except OSError as e:
+            color_message("** Error: cannot read %s: %s **" % (args.url_file, str(e)), error_color)
+            sys.exit(1)
+    if not urls and not args.daemon:
+        parser.error("no url given")
+    if args.daemon:
+        # no terminal to show the live display
+        live = 0
 
     if args.socks:
         (socks_proxy, socks_port) = args.socks.split(":")
@@ -1125,37 +3848,100 @@ def main():
         socks_port = int(socks_port)
 
     try:
-        layout["header"].update(Header())
+        metrics = Metrics(args.metrics_log)
+    except OSError as e:
+        color_message("** Error: cannot open %s: %s **" % (args.metrics_log, str(e)), error_color)
+        sys.exit(1)
+    if args.metrics_file:
+        threading.Thread(target=write_metrics_periodically, args=(args.metrics_file, metrics_interval),
+                         daemon=True).start()
+
+    if args.profile:
+        profiler = Profiler(args.profile, args.profile_interval / 1000)
+        profiler.start()
+
+    # sqlite3 is only imported for the state database and the page cache
+    if args.state_db or args.state_db_path or args.dedupe or args.cache or args.cache_path:
+        import sqlite3
+
+    # --dedupe finds the songs of the other albums in the state database
+    if args.state_db or args.state_db_path or args.dedupe:
+        state_db_path = args.state_db_path or os.path.join(args.path, ".generic-zic-downloader.db")
+        try:
+            state_db = StateDB(state_db_path)
+        except sqlite3.Error as e:
+            color_message("** Error: cannot open the state database %s: %s **" % (state_db_path, str(e)), error_color)
+            sys.exit(1)
+        if args.dedupe:
+            content_store = ContentStore(state_db)
+
+    if (args.cache or args.cache_path) and args.cache_size > 0:
+        cache_path = args.cache_path or os.path.join(args.path, ".generic-zic-downloader.cache")
+        try:
+            page_cache = PageCache(cache_path, args.cache_ttl, args.cache_size * 1024 * 1024)
+        except sqlite3.Error as e:
+            color_message("** Error: cannot open the page cache %s: %s **" % (cache_path, str(e)), error_color)
+            sys.exit(1)
+
+    try:
+        if live:
+            load_live_ui()
+            layout["header"].update(Header())
         reset_errors()
         reset_progress()
 
-        if live:
-            with Live(layout, refresh_per_second=4, vertical_overflow="visible"):
-                if re.search(r"%s" % re_artist_url, args.url, re.IGNORECASE):
-                    download_artist(args.url, args.path, with_album_id)
-                elif re.search(r"%s" % re_album_url, args.url, re.IGNORECASE):
-                    download_album(args.url, args.path, with_album_id)
-                else:
-                    color_message(
-                        "** Error: unable to recognize url, it should contain '%s' or '%s'! **" 
-                        % (re_artist_url, re_album_url), error_color)
+        if args.daemon:
+            run_daemon(args.daemon, urls, args.path, with_album_id)
+        elif live:
+            with Live(layout, refresh_per_second=live_refresh, vertical_overflow="visible"):
+                ui_events.start()
+                try:
+                    download_urls(urls, args.path, with_album_id)
+                finally:
+                    ui_events.stop()
         else:
-            if re.search(r"%s" % re_artist_url, args.url, re.IGNORECASE):
-                download_artist(args.url, args.path, with_album_id)
-            elif re.search(r"%s" % re_album_url, args.url, re.IGNORECASE):
-                download_album(args.url, args.path, with_album_id)
-            else:
-                color_message(
-                    "** Error: unable to recognize url, it should contain '%s' or '%s'! **" 
-                    % (re_artist_url, re_album_url), error_color)
+            download_urls(urls, args.path, with_album_id)
 
     except Exception as e:
-        color_message("** Error: Cannot download URL: %s, reason: %s **" % (args.url, str(e)), error_color)
+        color_message("** Error: Cannot download URL(s): %s, reason: %s **" 
+            % (" ".join(urls), str(e)), error_color)
         traceback.print_exc()
     except KeyboardInterrupt as e:
         color_message("** main: Program interrupted by user, exiting! **", error_color)
         #traceback.print_exc()
         exit(1)
+    finally:
+        http_pool.close_all()
+        if state_db:
+            state_db.close()
+        if page_cache:
+            page_cache.close()
+        if args.metrics_file:
+            metrics.write_prometheus(args.metrics_file)
+        metrics.close()
+        profile_report = profiler.stop() if profiler else []
+        if stream_output and stream_output is not sys.stdout.buffer:
+            stream_output.close()
+
+    # printed outside of the live display so that it stays visible
+    for (msg, color) in run_summary.report():
+        get_console().print(msg, style=color)
+    get_console().print("** HTTP connections: %s opened, %s reused **" 
+        % (http_pool.opened, http_pool.reused), style=ok_color)
+    if rate_limiter.hosts:
+        get_console().print("** Transfers: %s **" % rate_limiter.report_totals(), style=ok_color)
+    if page_cache:
+        get_console().print("** Page cache: %s hits, %s pages revalidated **" 
+            % (page_cache.hits, page_cache.revalidated), style=ok_color)
+    if content_store:
+        get_console().print("** Deduplication: %s **" % content_store.report(), style=ok_color)
+    if profiler:
+        get_console().print(phases_table())
+        for line in profile_report:
+            get_console().print(line, highlight=False, markup=False)
+    elif metrics.phases_report():
+        # summed over the simultaneous downloads
+        get_console().print("** Time spent: %s **" % metrics.phases_report(), style=ok_color)
 
 
 if __name__ == "__main__":